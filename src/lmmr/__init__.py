@@ -6,4 +6,7 @@ import lmmr.io
 import lmmr.utilities
 import lmmr.sampling
 import lmmr.random
+import lmmr.parallel
 import lmmr.index_magic
+import lmmr.mlmc
+import lmmr.kde
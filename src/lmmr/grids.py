@@ -11,3 +11,166 @@ def uniform_boundaries(x):
     x_bd[-1] = x[-1] + 0.5 * dx
 
     return x_bd
+
+
+class Grid:
+    """Tensor product grid of cells in N dimensions.
+
+    The grid is defined by the boundaries of its cells in each dimension. The
+    centers, widths and volumes of the cells are computed when first needed and
+    then cached.
+
+    Use sparse meshes, which broadcast against each other, rather than dense
+    ones:
+
+        grid = Grid.uniform([0.0, 0.0, 0.0], [1.0, 1.0, 1.0], (512, 512, 512))
+        x, y, z = grid.mesh()
+        u = np.sin(x) * np.cos(y) * z
+
+    Cell averages can be transferred between resolutions with `restrict` and
+    `prolong`, e.g. for convergence studies.
+    """
+
+    def __init__(self, boundaries, is_uniform=None):
+        if isinstance(boundaries, np.ndarray):
+            boundaries = [boundaries]
+
+        self.boundaries = [np.asarray(x_bd, dtype=float) for x_bd in boundaries]
+
+        if is_uniform is None:
+            is_uniform = all(
+                np.allclose(np.diff(x), x[1] - x[0]) for x in self.boundaries
+            )
+
+        self.is_uniform = is_uniform
+        self._cache = {}
+
+    @classmethod
+    def uniform(cls, xmin, xmax, shape):
+        """Uniform grid of `[xmin, xmax]` with `shape` cells."""
+        xmin, xmax = np.atleast_1d(xmin), np.atleast_1d(xmax)
+        shape = np.broadcast_to(shape, xmin.shape)
+
+        boundaries = [np.linspace(a, b, n + 1) for a, b, n in zip(xmin, xmax, shape)]
+        return cls(boundaries, is_uniform=True)
+
+    @classmethod
+    def from_centers(cls, centers):
+        """Uniform grid with the given cell centers in each dimension."""
+        if isinstance(centers, np.ndarray):
+            centers = [centers]
+
+        return cls([uniform_boundaries(x) for x in centers], is_uniform=True)
+
+    @property
+    def n_dims(self):
+        return len(self.boundaries)
+
+    @property
+    def shape(self):
+        return tuple(x_bd.size - 1 for x_bd in self.boundaries)
+
+    @property
+    def centers(self):
+        """The cell centers in each dimension."""
+        return self._cached(
+            "centers", lambda: [0.5 * (x[:-1] + x[1:]) for x in self.boundaries]
+        )
+
+    @property
+    def widths(self):
+        """The cell widths in each dimension."""
+        return self._cached("widths", lambda: [np.diff(x) for x in self.boundaries])
+
+    @property
+    def volumes(self):
+        """The volume of each cell.
+
+        For uniform grids this is a read-only view of a single value.
+        """
+        return self._cached("volumes", self._volumes)
+
+    def mesh(self):
+        """Sparse mesh of the cell centers, see `np.meshgrid(..., sparse=True)`."""
+        return np.meshgrid(*self.centers, indexing="ij", sparse=True)
+
+    def boundary_mesh(self):
+        """Sparse mesh of the cell boundaries."""
+        return np.meshgrid(*self.boundaries, indexing="ij", sparse=True)
+
+    def refine(self, factor=2):
+        """Grid with each cell split into `factor` cells per dimension."""
+        factor = self._factors(factor)
+
+        boundaries = []
+        for x_bd, f in zip(self.boundaries, factor):
+            t = np.arange(f) / f
+            x = x_bd[:-1, np.newaxis] + np.diff(x_bd)[:, np.newaxis] * t
+            boundaries.append(np.append(x.reshape(-1), x_bd[-1]))
+
+        return Grid(boundaries, is_uniform=self.is_uniform)
+
+    def coarsen(self, factor=2):
+        """Grid with `factor` cells per dimension merged into one."""
+        factor = self._factors(factor)
+
+        for n, f in zip(self.shape, factor):
+            if n % f != 0:
+                raise ValueError(f"Can't coarsen {n} cells by a factor of {f}.")
+
+        boundaries = [x_bd[::f] for x_bd, f in zip(self.boundaries, factor)]
+        return Grid(boundaries, is_uniform=self.is_uniform)
+
+    def restrict(self, u, factor=2):
+        """Cell averages `u` on this grid, averaged onto `self.coarsen(factor)`.
+
+        The averages are weighted by the volume of the cells, therefore, the
+        integral of `u` is preserved.
+        """
+        factor = self._factors(factor)
+
+        for k, (n, f) in enumerate(zip(self.shape, factor)):
+            blocks = u.shape[:k] + (n // f, f) + u.shape[k + 1 :]
+            u = u.reshape(blocks)
+
+            if self.is_uniform:
+                u = np.mean(u, axis=k + 1)
+            else:
+                w = self.widths[k].reshape((n // f, f) + (1,) * (u.ndim - k - 2))
+                u = np.sum(u * w, axis=k + 1) / np.sum(w, axis=1)
+
+        return u
+
+    def prolong(self, u, factor=2):
+        """Cell averages `u` on this grid, as averages on `self.refine(factor)`.
+
+        The values are piecewise constant, therefore, `restrict` undoes this.
+        """
+        factor = self._factors(factor)
+
+        for k, f in enumerate(factor):
+            u = np.repeat(u, f, axis=k)
+
+        return u
+
+    def _factors(self, factor):
+        return tuple(np.broadcast_to(factor, (self.n_dims,)))
+
+    def _volumes(self):
+        if self.is_uniform:
+            volume = np.prod([dx[0] for dx in self.widths])
+            return np.broadcast_to(volume, self.shape)
+
+        widths = np.meshgrid(*self.widths, indexing="ij", sparse=True)
+
+        volumes = widths[0]
+        for dx in widths[1:]:
+            volumes = volumes * dx
+
+        return np.broadcast_to(volumes, self.shape)
+
+    def _cached(self, key, compute):
+        if key not in self._cache:
+            self._cache[key] = compute()
+
+        return self._cache[key]
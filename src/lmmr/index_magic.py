@@ -1,10 +1,15 @@
 # SPDX-License-Identifier: MIT
 # Copyright (c) 2021 ETH Zurich, Luc Grosheintz-Laval
 
+import itertools
+
 import numpy as np
 
+import lmmr.random
+from lmmr.utilities import merge_moments
+
 
-def percentile_indices(values, percentiles):
+def percentile_indices(values, percentiles, axis=None, nan_policy="omit"):
     """Compute the indices corresponding to certain percentiles.
 
     Example:
@@ -12,14 +17,75 @@ def percentile_indices(values, percentiles):
         I = percentile_indices(x, [0.0, 0.5, 0.75, 0.9, 0.99, 1.0])
         print(x[I])
 
+    The index of the percentile `p` is the index of the `int(p * (n - 1))`-th
+    smallest value. Ties are broken by position, i.e. as with a stable sort.
+
+    Along an axis of an N-D array, the result has the shape of `values` with
+    `axis` replaced by the percentiles, such that
+        np.take_along_axis(x, I, axis=axis)
+    are the percentiles of `x`.
+
     Args:
-        values: 1D array from which certain percentiles should be taken.
+        values: Array from which certain percentiles should be taken. If `axis`
+            is `None`, the flattened array is used.
         percentiles: 1D array of percentiles.
+        axis: Axis along which to compute the percentiles.
+        nan_policy: If `"omit"`, NaNs are ignored; if `"raise"`, a `ValueError`
+            is raised if `values` contains NaNs.
     """
 
-    n_values = values.size
-    ranked_values = sorted(np.arange(n_values), key=lambda i: values[i])
-    return [ranked_values[int(p * (n_values - 1))] for p in percentiles]
+    values = np.asarray(values)
+    percentiles = np.asarray(percentiles, dtype=float)
+
+    if axis is None:
+        x = values.reshape(-1)
+    else:
+        x = np.moveaxis(values, axis, -1)
+
+    n_values = x.shape[-1]
+    if n_values == 0:
+        raise ValueError("Can't compute percentiles of an empty array.")
+
+    n_valid = np.full(x.shape[:-1], n_values)
+
+    if np.issubdtype(x.dtype, np.inexact):
+        n_valid = n_valid - np.sum(np.isnan(x), axis=-1)
+
+    if nan_policy == "raise":
+        if np.any(n_valid != n_values):
+            raise ValueError("The values contain NaNs.")
+
+    elif nan_policy == "omit":
+        if np.any(n_valid == 0):
+            raise ValueError("All-NaN slice encountered.")
+
+    else:
+        raise ValueError(f"Unknown `nan_policy`: {nan_policy}")
+
+    # NaNs are partitioned to the end, therefore, omitting them only requires
+    # the ranks to be computed from the number of valid values.
+    ranks = (percentiles * (n_valid[..., np.newaxis] - 1)).astype(np.int64)
+
+    I = np.argpartition(x, np.unique(ranks), axis=-1)
+    I = np.take_along_axis(I, ranks, axis=-1)
+
+    # `argpartition` isn't stable. Among equal values pick the one a stable sort
+    # would have placed at the requested rank.
+    for k in range(percentiles.size):
+        v = np.take_along_axis(x, I[..., k : k + 1], axis=-1)
+        is_equal = x == v
+
+        if np.all(np.sum(is_equal, axis=-1) == 1):
+            continue
+
+        r = ranks[..., k] - np.sum(x < v, axis=-1)
+        is_rank = np.cumsum(is_equal, axis=-1) > r[..., np.newaxis]
+        I[..., k] = np.argmax(is_rank, axis=-1)
+
+    if axis is None:
+        return I
+
+    return np.moveaxis(I, -1, axis)
 
 
 def uniform_bin_index(x, min_max_n=None, centers=None):
@@ -36,3 +102,380 @@ def uniform_bin_index(x, min_max_n=None, centers=None):
     i = np.array(np.floor((x - xmin) / dx), dtype=np.int64)
 
     return np.clip(i, 0, n - 1)
+
+
+def linear_binning(x, centers, weights=None):
+    """Distribute points linearly onto the nodes of a uniform grid.
+
+    Each point is split between the `2**n_dims` surrounding nodes, with
+    weights given by linear interpolation. Points outside the grid are moved
+    to its boundary.
+
+    Args:
+        x: Points of shape `(n_points, n_dims)`, or `(n_points,)` in 1D.
+        centers: The uniformly spaced nodes, one array per dimension. In 1D
+            the array itself can be passed.
+        weights: Weight of each point; by default one.
+
+    Returns:
+        The sum of the weights at each node, of shape `(n_1, ..., n_dims)`.
+    """
+    if isinstance(centers, np.ndarray):
+        centers = [centers]
+
+    x = np.asarray(x).reshape(-1, len(centers))
+    shape = tuple(c.size for c in centers)
+
+    I, W = [], []
+    for k, c in enumerate(centers):
+        t = np.clip((x[:, k] - c[0]) / (c[1] - c[0]), 0.0, c.size - 1)
+        i = np.minimum(np.floor(t).astype(np.int64), c.size - 2)
+
+        I.append(i)
+        W.append(t - i)
+
+    counts = np.zeros(np.prod(shape))
+    for corner in itertools.product((0, 1), repeat=len(centers)):
+        index = np.ravel_multi_index([i + o for i, o in zip(I, corner)], shape)
+
+        w = np.ones(x.shape[0]) if weights is None else np.array(weights, dtype=float)
+        for o, w_k in zip(corner, W):
+            w *= w_k if o else 1.0 - w_k
+
+        counts += np.bincount(index, weights=w, minlength=counts.size)
+
+    return counts.reshape(shape)
+
+
+def bin_index(x, edges):
+    """Index of the bin containing `x` for non-uniform bins.
+
+    The `n` bins are `[edges[i], edges[i+1])`. Just as for `uniform_bin_index`
+    values outside the bins are assigned to the first or last bin.
+    """
+    n = edges.size - 1
+    i = np.searchsorted(edges, x, side="right") - 1
+
+    return np.clip(i, 0, n - 1)
+
+
+class Binning:
+    """Assignment of N-D points to a tensor product of bins.
+
+    Each dimension is either uniform, specified as `(xmin, xmax, n)`, or given
+    by the `n + 1` edges of the bins as an array. For a single dimension the
+    bins can be passed directly, otherwise pass a list with one entry per
+    dimension:
+
+        binning = Binning([(0.0, 1.0, 100), np.array([0.0, 0.1, 0.5, 1.0])])
+        I = binning.index(x)
+
+    where `x` has shape `(n_points, n_dims)`, or `(n_points,)` in 1D. The index
+    is the flat index of the bin in an array of shape `binning.shape`.
+    """
+
+    def __init__(self, bins):
+        if isinstance(bins, np.ndarray) or np.isscalar(bins[0]):
+            bins = [bins]
+
+        self.bins = [b if isinstance(b, tuple) else np.asarray(b) for b in bins]
+        self.shape = tuple(self._n_bins(b) for b in self.bins)
+
+    @property
+    def n_dims(self):
+        return len(self.shape)
+
+    @property
+    def size(self):
+        return int(np.prod(self.shape))
+
+    @property
+    def edges(self):
+        """The edges of the bins in each dimension."""
+        return [
+            np.linspace(b[0], b[1], b[2] + 1) if isinstance(b, tuple) else b
+            for b in self.bins
+        ]
+
+    def index(self, x):
+        """The flat index of the bin of each point in `x`."""
+        x = np.asarray(x)
+        if x.ndim == 1:
+            x = x.reshape(-1, 1)
+
+        if x.shape[1] != self.n_dims:
+            raise ValueError(f"Expected {self.n_dims} dimensions, got {x.shape[1]}.")
+
+        I = [self._index(x[:, k], b) for k, b in enumerate(self.bins)]
+        return np.ravel_multi_index(I, self.shape)
+
+    @staticmethod
+    def _n_bins(b):
+        return b[2] if isinstance(b, tuple) else b.size - 1
+
+    @staticmethod
+    def _index(x, b):
+        if isinstance(b, tuple):
+            return uniform_bin_index(x, min_max_n=b)
+        else:
+            return bin_index(x, b)
+
+
+class Histogram:
+    """Per-bin statistics of values, accumulated in chunks.
+
+    Example:
+        histogram = Histogram(Binning([(0.0, 1.0, 100), (0.0, 1.0, 100)]))
+        for x, values in chunks:
+            histogram.add(x, values)
+
+        mean, variance = histogram.mean, histogram.variance
+
+    The statistics are arrays of shape `binning.shape`. Without `values` only
+    the points are counted; the statistics of the values, e.g. `mean`, only
+    include the points which were added with values. The bin of each point can
+    be computed once with `binning.index(x)` and passed as `index` instead of
+    `x`, e.g. when binning many different values at the same points.
+    """
+
+    def __init__(self, binning):
+        if not isinstance(binning, Binning):
+            binning = Binning(binning)
+
+        self.binning = binning
+
+        n = binning.size
+        self._count = np.zeros(n, dtype=np.int64)
+        self._n_values = np.zeros(n, dtype=np.int64)
+        self._sum = np.zeros(n)
+        self._M2 = np.zeros(n)
+        self._min = np.full(n, np.inf)
+        self._max = np.full(n, -np.inf)
+
+    def add(self, x=None, values=None, index=None):
+        """Add the points `x` with associated `values`."""
+        if index is None:
+            index = self.binning.index(x)
+
+        n = self.binning.size
+        count = np.bincount(index, minlength=n)
+        self._count += count
+
+        if values is None:
+            return
+
+        values = np.asarray(values).reshape(-1)
+        total = np.bincount(index, weights=values, minlength=n)
+        mean = np.divide(total, count, out=np.zeros(n), where=count > 0)
+        M2 = np.bincount(index, weights=(values - mean[index]) ** 2, minlength=n)
+
+        np.minimum.at(self._min, index, values)
+        np.maximum.at(self._max, index, values)
+
+        self._merge(count, total, M2)
+
+    def merge(self, other):
+        """Add the statistics of `other`, with the same binning."""
+        if self.binning.shape != other.binning.shape:
+            raise ValueError("The histograms must have the same binning.")
+
+        np.minimum(self._min, other._min, out=self._min)
+        np.maximum(self._max, other._max, out=self._max)
+
+        self._count += other._count
+        self._merge(other._n_values, other._sum, other._M2)
+
+    @property
+    def count(self):
+        return self._reshape(self._count)
+
+    @property
+    def sum(self):
+        return self._reshape(self._sum)
+
+    @property
+    def mean(self):
+        """The mean of the values in each bin; NaN for empty bins."""
+        mean = np.full(self._sum.shape, np.nan)
+        np.divide(self._sum, self._n_values, out=mean, where=self._n_values > 0)
+        return self._reshape(mean)
+
+    @property
+    def variance(self):
+        """The sample variance of the values in each bin; NaN if undefined."""
+        variance = np.full(self._M2.shape, np.nan)
+        n = self._n_values
+        np.divide(self._M2, n - 1, out=variance, where=n > 1)
+        return self._reshape(variance)
+
+    @property
+    def min(self):
+        return self._reshape(np.where(self._n_values > 0, self._min, np.nan))
+
+    @property
+    def max(self):
+        return self._reshape(np.where(self._n_values > 0, self._max, np.nan))
+
+    def _merge(self, count, total, M2):
+        n = self._n_values
+        mean = np.divide(self._sum, n, out=np.zeros(n.shape), where=n > 0)
+        mean_new = np.divide(total, count, out=np.zeros(n.shape), where=count > 0)
+
+        self._n_values, _, self._M2 = merge_moments(
+            (n, mean, self._M2), (count, mean_new, M2)
+        )
+        self._sum += total
+
+    def _reshape(self, a):
+        return a.reshape(self.binning.shape)
+
+
+class QuantileSketch:
+    """Approximate quantiles of a stream of values, with bounded memory.
+
+    The sketch is a KLL sketch, see Karnin, Lang, Liberty (2016),
+    https://arxiv.org/abs/1603.05346. It stores at most about `3 * k` values.
+    The error of the rank of a quantile is roughly `1.7 / k`, relative to the
+    number of values. Sketches of different parts of the data, e.g. from
+    different files or workers, can be merged.
+
+    Example:
+        sketch = QuantileSketch(track_indices=True)
+        for offset, x in chunks:
+            sketch.update(x, indices=offset + np.arange(x.size))
+
+        q = sketch.quantile([0.5, 0.99])
+        I = sketch.quantile_indices([0.5, 0.99])
+
+    If `track_indices` is true, the index of every value is stored with the
+    value, such that the index of a sample close to each quantile can be
+    retrieved. NaNs are ignored.
+    """
+
+    def __init__(self, k=200, track_indices=False):
+        self.k = k
+        self.track_indices = track_indices
+
+        self.n_values = 0
+        self.levels = [np.empty(0)]
+        self.indices = [np.empty(0, dtype=np.int64)]
+
+    def update(self, values, indices=None):
+        """Add a batch of values to the sketch.
+
+        By default, the indices of the values are consecutive, counting all
+        values added to this sketch.
+        """
+        values = np.asarray(values).reshape(-1)
+
+        if self.track_indices:
+            if indices is None:
+                indices = self.n_values + np.arange(values.size)
+            indices = np.asarray(indices, dtype=np.int64).reshape(-1)
+
+        if np.issubdtype(values.dtype, np.inexact):
+            is_valid = np.logical_not(np.isnan(values))
+            values = values[is_valid]
+            if self.track_indices:
+                indices = indices[is_valid]
+
+        self.n_values += values.size
+        self.levels[0] = np.concatenate((self.levels[0], values))
+        if self.track_indices:
+            self.indices[0] = np.concatenate((self.indices[0], indices))
+
+        self._compress()
+
+    def merge(self, other):
+        """Add all values of the sketch `other` to this sketch."""
+        if self.k != other.k or self.track_indices != other.track_indices:
+            raise ValueError("Only sketches with the same parameters can be merged.")
+
+        while len(self.levels) < len(other.levels):
+            self._add_level()
+
+        for h in range(len(other.levels)):
+            self.levels[h] = np.concatenate((self.levels[h], other.levels[h]))
+            self.indices[h] = np.concatenate((self.indices[h], other.indices[h]))
+
+        self.n_values += other.n_values
+        self._compress()
+
+    def quantile(self, percentiles):
+        """Approximate values at the `percentiles`, which lie in `[0, 1]`."""
+        values, _ = self._select(percentiles)
+        return values
+
+    def quantile_indices(self, percentiles):
+        """Indices of values which are approximately at the `percentiles`.
+
+        The convention is the same as for `percentile_indices`.
+        """
+        if not self.track_indices:
+            raise ValueError("The sketch doesn't track indices.")
+
+        _, indices = self._select(percentiles)
+        return indices
+
+    def _select(self, percentiles):
+        if self.n_values == 0:
+            raise ValueError("The sketch is empty.")
+
+        percentiles = np.asarray(percentiles, dtype=float)
+
+        values = np.concatenate(self.levels)
+        weights = np.concatenate(
+            [np.full(v.size, 2 ** h, dtype=np.int64) for h, v in enumerate(self.levels)]
+        )
+
+        order = np.argsort(values, kind="stable")
+        cumulative_weights = np.cumsum(weights[order])
+
+        ranks = (percentiles * (self.n_values - 1)).astype(np.int64)
+        i = order[np.searchsorted(cumulative_weights, ranks, side="right")]
+
+        if self.track_indices:
+            return values[i], np.concatenate(self.indices)[i]
+
+        return values[i], None
+
+    def _capacity(self, h):
+        depth = len(self.levels) - 1 - h
+        return max(int(self.k * (2.0 / 3.0) ** depth), 2)
+
+    def _add_level(self):
+        self.levels.append(np.empty(0, dtype=self.levels[0].dtype))
+        self.indices.append(np.empty(0, dtype=np.int64))
+
+    def _compress(self):
+        # Adding a level lowers the capacity of all lower levels, therefore
+        # repeat until every level fits.
+        is_compressed = False
+        while not is_compressed:
+            is_compressed = True
+
+            for h in range(len(self.levels)):
+                if self.levels[h].size > self._capacity(h):
+                    self._compact(h)
+                    is_compressed = False
+
+    def _compact(self, h):
+        """Promote every other of the sorted values of level `h`."""
+        if h + 1 == len(self.levels):
+            self._add_level()
+
+        values = self.levels[h]
+        order = np.argsort(values, kind="stable")
+
+        m = values.size - values.size % 2
+        offset = lmmr.random.global_rng().integers(2)
+        promoted, kept = order[offset:m:2], order[m:]
+
+        self.levels[h + 1] = np.concatenate((self.levels[h + 1], values[promoted]))
+        self.levels[h] = values[kept]
+
+        if self.track_indices:
+            indices = self.indices[h]
+            promoted_indices = (self.indices[h + 1], indices[promoted])
+            self.indices[h + 1] = np.concatenate(promoted_indices)
+            self.indices[h] = indices[kept]
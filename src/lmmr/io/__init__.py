@@ -11,6 +11,11 @@ from .basics import read_json, write_json
 from .basics import read_pickle, write_pickle
 from .basics import read_csv
 from .basics import read_array, read_array_shape
+from .basics import iter_array_chunks
+from .basics import read_arrays
+from .basics import write_array, ArrayAppender
+from .basics import FileHandlePool
+from .basics import enable_file_handle_pool, disable_file_handle_pool
 from .basics import savefig
 from .basics import NumpyEncoder
 
@@ -7,6 +7,11 @@ import pickle
 import itertools
 import csv
 import hashlib
+import atexit
+import threading
+import contextlib
+import collections
+import concurrent.futures
 
 import lmmr
 
@@ -54,12 +59,146 @@ def _guess_hdf5_netcdf(filename):
         raise RuntimeError("Can't deduce file format.")
 
 
-def read_array(filename, key, slices=None, format=None):
+class FileHandlePool:
+    """Bounded LRU cache of open, read-only HDF5 and NetCDF files.
+
+    Files are identified by their path and modification time, a file which
+    has been modified since it was opened is reopened. The least recently used
+    file is closed when more than `max_size` files are open.
+
+    Since the files remain open, they must be closed, see `close`, before they
+    can be written to by the same process.
+
+    Each HDF5 file is used by at most one thread at a time. Since netCDF4 isn't
+    thread-safe, at most one thread at a time uses any of the NetCDF files. The
+    pool itself can be used from any number of threads.
+    """
+
+    def __init__(self, max_size=16):
+        self.max_size = max_size
+
+        self._handles = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._netcdf_lock = threading.RLock()
+
+    @contextlib.contextmanager
+    def open(self, filename, format):
+        """Context manager for the open file."""
+        path = os.path.abspath(filename)
+        key = (path, os.stat(path).st_mtime_ns, format)
+
+        with self._lock:
+            handle = self._handles.get(key)
+
+            if handle is None:
+                for k in [k for k in self._handles if k[0] == path]:
+                    self._evict(k)
+
+                lock = self._netcdf_lock if format == "NETCDF" else threading.RLock()
+                handle = _PooledFile(_open_file(filename, format), lock)
+                self._handles[key] = handle
+
+                while len(self._handles) > self.max_size:
+                    self._evict(next(iter(self._handles)))
+
+            self._handles.move_to_end(key)
+            handle.n_users += 1
+
+        try:
+            with handle.lock:
+                yield handle.file
+
+        finally:
+            with self._lock:
+                handle.n_users -= 1
+                if handle.is_evicted and handle.n_users == 0:
+                    handle.file.close()
+
+    def close(self, filename=None):
+        """Close `filename`, or all files."""
+        with self._lock:
+            keys = list(self._handles)
+            if filename is not None:
+                keys = [k for k in keys if k[0] == os.path.abspath(filename)]
+
+            for k in keys:
+                self._evict(k)
+
+    def _evict(self, key):
+        # Files still in use are closed by the last user.
+        handle = self._handles.pop(key)
+        handle.is_evicted = True
+
+        if handle.n_users == 0:
+            handle.file.close()
+
+
+class _PooledFile:
+    def __init__(self, file, lock):
+        self.file = file
+        self.lock = lock
+        self.n_users = 0
+        self.is_evicted = False
+
+
+def enable_file_handle_pool(max_size=16):
+    """Keep files opened by `read_array*` open in a `FileHandlePool`."""
+    disable_file_handle_pool()
+
+    enable_file_handle_pool.pool = FileHandlePool(max_size)
+    atexit.register(enable_file_handle_pool.pool.close)
+
+
+def disable_file_handle_pool():
+    """Close all pooled files and stop pooling."""
+    pool = getattr(enable_file_handle_pool, "pool", None)
+
+    if pool is not None:
+        enable_file_handle_pool.pool = None
+        atexit.unregister(pool.close)
+        pool.close()
+
+
+def _open_file(filename, format):
+    if format == "HDF5":
+        import h5py
+
+        return h5py.File(filename, "r")
+
+    if format == "NETCDF":
+        import netCDF4
+
+        return netCDF4.Dataset(filename, "r")
+
+    raise RuntimeError(f"Unknown format. [{format}]")
+
+
+@contextlib.contextmanager
+def _open(filename, format):
+    """Open the file for reading, or fetch it from the pool, if enabled."""
+    pool = getattr(enable_file_handle_pool, "pool", None)
+
+    if pool is not None:
+        with pool.open(filename, format) as f:
+            yield f
+
+    else:
+        with _open_file(filename, format) as f:
+            yield f
+
+
+def read_array(filename, key, slices=None, format=None, mmap=False):
+    """Read the array `key`, or the part selected by `slices`.
+
+    If `mmap` is true, contiguous and unfiltered HDF5 datasets are returned as
+    a read-only `np.memmap`, see `read_array_h5`. Otherwise, the array is copied
+    into memory.
+    """
     if format is None:
         format = _guess_hdf5_netcdf(filename)
 
     if format == "HDF5":
-        return read_array_h5(filename, key, slices)
+        return read_array_h5(filename, key, slices, mmap=mmap)
 
     if format == "NETCDF":
         return read_array_nc(filename, key, slices)
@@ -67,34 +206,441 @@ def read_array(filename, key, slices=None, format=None):
     raise RuntimeError(f"Unknown format. [{format}]")
 
 
-def read_array_h5(filename, key, slices=None):
+def read_array_h5(filename, key, slices=None, mmap=False):
+    """Read the array `key`, or the part selected by `slices`.
+
+    If `mmap` is true and the dataset is stored contiguously, i.e. isn't chunked
+    or compressed, a read-only `np.memmap` of the dataset is returned; no data
+    is read until it's accessed. This requires `slices` to consist of slices
+    and integers only. Otherwise, the array is copied into memory.
+    """
     import numpy as np
-    import h5py
 
-    with h5py.File(filename, "r") as h5:
+    with _open(filename, "HDF5") as h5:
+        dataset = h5[key]
+
+        if mmap and _is_basic_index(slices):
+            offset = _contiguous_offset(dataset)
+
+            if offset is not None:
+                array = np.memmap(
+                    filename,
+                    mode="r",
+                    dtype=dataset.dtype,
+                    shape=dataset.shape,
+                    offset=offset,
+                )
+                return array if slices is None else array[slices]
+
         if slices is None:
-            return np.array(h5[key])
+            return np.array(dataset)
 
         else:
-            return np.array(h5[key][slices])
+            return np.array(dataset[slices])
+
+
+def _contiguous_offset(dataset):
+    """Offset of the data in the file, or `None` if it can't be memory mapped."""
+    if dataset.chunks is not None or dataset.external is not None:
+        return None
+
+    if dataset.dtype.hasobject or dataset.size == 0:
+        return None
+
+    # `None` if no storage has been allocated yet.
+    return dataset.id.get_offset()
+
+
+def _is_basic_index(slices):
+    import numpy as np
+
+    if slices is None:
+        return True
+
+    if not isinstance(slices, tuple):
+        slices = (slices,)
+
+    basic_types = (slice, int, np.integer, type(Ellipsis))
+    return all(isinstance(s, basic_types) for s in slices)
 
 
 def read_array_nc(filename, key, slices=None):
     import numpy as np
-    import netCDF4
 
-    if slices is not None:
-        raise NotImplemented("Slicing must be implement first.")
+    with _open(filename, "NETCDF") as nc:
+        if slices is None:
+            return np.array(nc[key])
+
+        else:
+            # netCDF4 only reads the requested hyperslab.
+            return np.array(nc[key][slices])
+
+
+def read_array_shape(filename, key, format=None):
+    if format is None:
+        format = _guess_hdf5_netcdf(filename)
+
+    with _open(filename, format) as f:
+        return f[key].shape
+
+
+def read_arrays(requests, max_workers=None, stack=False):
+    """Read many arrays concurrently.
+
+    Example:
+        requests = [(filename, "u", np.s_[0, :]) for filename in filenames]
+        arrays = read_arrays(requests, max_workers=8)
+
+    Each request is `(filename, key)` or `(filename, key, slices)`, see
+    `read_array`. All requests for the same file are read by the same worker
+    and the file is opened only once. HDF5 files are read by threads. Since
+    netCDF4 isn't thread-safe, NetCDF files are read by processes.
+
+    Returns:
+        The arrays in the order of the requests. If `stack` is true, the arrays
+        must have the same shape and are returned as one array, with the
+        requests along axis 0.
+    """
+    import numpy as np
+
+    requests = list(requests)
+
+    groups = collections.OrderedDict()
+    for i, request in enumerate(requests):
+        filename, key, slices = (tuple(request) + (None,))[:3]
+        groups.setdefault(filename, []).append((i, key, slices))
+
+    arrays = [None] * len(requests)
+    stacked = None
+
+    with contextlib.ExitStack() as exit_stack:
+        executors = {}
+
+        def executor(format):
+            if format not in executors:
+                if format == "NETCDF":
+                    Executor = concurrent.futures.ProcessPoolExecutor
+                else:
+                    Executor = concurrent.futures.ThreadPoolExecutor
+
+                executors[format] = exit_stack.enter_context(Executor(max_workers))
+
+            return executors[format]
+
+        futures = {}
+        for filename, items in groups.items():
+            format = _guess_hdf5_netcdf(filename)
+            future = executor(format).submit(_read_group, filename, format, items)
+            futures[future] = items
+
+        for future in concurrent.futures.as_completed(futures):
+            for (i, _, _), array in zip(futures[future], future.result()):
+                if not stack:
+                    arrays[i] = array
+                    continue
+
+                if stacked is None:
+                    shape = (len(requests),) + array.shape
+                    stacked = np.empty(shape, dtype=array.dtype)
 
-    with netCDF4.Dataset(filename, "r") as nc:
-        return np.array(nc[key])
+                if array.shape != stacked.shape[1:]:
+                    raise ValueError("Only arrays of the same shape can be stacked.")
 
+                stacked[i] = array
+
+    if not stack:
+        return arrays
+
+    return np.empty((0,)) if stacked is None else stacked
+
+
+def _read_group(filename, format, items):
+    """Read all `(i, key, slices)` in `items` from the same file."""
+    with _open_file(filename, format) as f:
+        return [_read_dataset(f, key, slices) for _, key, slices in items]
+
+
+def _read_dataset(f, key, slices):
+    import numpy as np
+
+    if slices is None:
+        return np.array(f[key])
+
+    else:
+        return np.array(f[key][slices])
+
+
+def iter_array_chunks(
+    filename, key, axis=0, target_bytes=2 ** 26, prefetch=None, format=None
+):
+    """Iterate over blocks of an array along `axis`.
+
+    Example:
+        total = 0.0
+        for (lo, hi), block in iter_array_chunks(filename, "u"):
+            total += np.sum(block)
+
+    The blocks are aligned with the chunks of the dataset and contain as many
+    chunks along `axis` as fit into `target_bytes`, but at least one. Only
+    about two blocks are kept in memory.
+
+    The block is read into a preallocated buffer, which is overwritten later.
+    Therefore, a block is only valid until the next block is requested; copy it
+    if needed for longer. If `prefetch` is true, the next block is read on a
+    background thread while the current one is processed. By default, HDF5
+    files are prefetched. NetCDF files can't be prefetched, since netCDF4 isn't
+    thread-safe.
+
+    The file is opened separately, i.e. not through the `FileHandlePool`, such
+    that other readers of the same file aren't blocked during the iteration.
+
+    Yields:
+        The range `(lo, hi)` of the block along `axis` and the block itself.
+    """
+    import numpy as np
+
+    if format is None:
+        format = _guess_hdf5_netcdf(filename)
+
+    if prefetch is None:
+        prefetch = format == "HDF5"
+
+    elif prefetch and format == "NETCDF":
+        raise ValueError("NetCDF files can't be prefetched.")
+
+    with _open_file(filename, format) as f:
+        dataset = f[key]
+        shape, dtype = dataset.shape, np.dtype(dataset.dtype)
+
+        chunks = _chunk_shape(dataset, format)
+        n_chunk = 1 if chunks is None else chunks[axis]
+        chunk_bytes = dtype.itemsize * n_chunk * np.prod(shape) // max(shape[axis], 1)
+        n_block = n_chunk * max(1, target_bytes // max(chunk_bytes, 1))
+
+        n = shape[axis]
+        bounds = [(lo, min(lo + n_block, n)) for lo in range(0, n, n_block)]
+
+        block_shape = shape[:axis] + (min(n_block, n),) + shape[axis + 1 :]
+        n_buffers = 2 if prefetch else 1
+        buffers = [np.empty(block_shape, dtype) for _ in range(n_buffers)]
+
+        def read(k):
+            lo, hi = bounds[k]
+            buffer = buffers[k % len(buffers)]
+
+            source = (slice(None),) * axis + (slice(lo, hi),)
+            dest = (slice(None),) * axis + (slice(0, hi - lo),)
+
+            if format == "HDF5":
+                dataset.read_direct(buffer, source, dest)
+            else:
+                buffer[dest] = dataset[source]
+
+            return buffer[dest]
+
+        if not prefetch:
+            for k in range(len(bounds)):
+                yield bounds[k], read(k)
+
+            return
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+            future = executor.submit(read, 0) if bounds else None
+
+            for k in range(len(bounds)):
+                block = future.result()
+                if k + 1 < len(bounds):
+                    future = executor.submit(read, k + 1)
+
+                yield bounds[k], block
+
+
+def _chunk_shape(dataset, format):
+    """The shape of the chunks of the dataset, or `None` if not chunked."""
+    if format == "HDF5":
+        return dataset.chunks
+
+    chunking = dataset.chunking()
+    return None if chunking == "contiguous" else tuple(chunking)
+
+
+class ArrayAppender:
+    """Append batches of samples to a chunked, compressed array on disk.
+
+    Example:
+        with ArrayAppender(filename, "samples", shape=(3,)) as appender:
+            for batch in batches:
+                appender.append(batch)
+
+    The samples are stored along axis 0 of a resizable dataset, which is
+    created if needed and otherwise appended to, unless `exist_ok` is false.
+    Each sample has shape `shape`.
+
+    By default, the chunks contain as many complete samples as fit into
+    `target_chunk_bytes`, which is efficient for reading consecutive samples,
+    e.g. using `iter_array_chunks`.
+
+    Args:
+        compression: For HDF5 any filter supported by h5py, e.g. `"gzip"` or
+            `"lzf"`, or `None`. NetCDF supports `"gzip"` and `None`.
+        compression_opts: Options of the filter, e.g. the level for `"gzip"`.
+        chunks: The shape of the chunks, overrides the automatic choice.
+    """
+
+    def __init__(
+        self,
+        filename,
+        key,
+        shape=(),
+        dtype=float,
+        compression="gzip",
+        compression_opts=None,
+        chunks=None,
+        target_chunk_bytes=2 ** 20,
+        format=None,
+        exist_ok=True,
+    ):
+        import numpy as np
+
+        self.filename = filename
+        self.key = key
+        self.format = _guess_hdf5_netcdf(filename) if format is None else format
+
+        shape, dtype = tuple(shape), np.dtype(dtype)
+        if chunks is None:
+            chunks = _auto_chunks(shape, dtype.itemsize, target_chunk_bytes)
+
+        # Pooled read-only handles would prevent opening the file for writing.
+        pool = getattr(enable_file_handle_pool, "pool", None)
+        if pool is not None:
+            pool.close(filename)
+
+        ensure_directory_exists(filename)
+
+        if self.format == "HDF5":
+            is_new = self._open_h5(shape, dtype, compression, compression_opts, chunks)
+
+        elif self.format == "NETCDF":
+            is_new = self._open_nc(shape, dtype, compression, compression_opts, chunks)
+
+        else:
+            raise RuntimeError(f"Unknown format. [{self.format}]")
+
+        if not is_new and not exist_ok:
+            self.close()
+            raise ValueError(f"The array already exists. [{key}]")
+
+        existing_shape = self.dataset.shape[1:]
+        if existing_shape != shape:
+            self.close()
+            raise ValueError(f"Shape mismatch: {existing_shape} != {shape}. [{key}]")
+
+    @property
+    def n_samples(self):
+        return self.dataset.shape[0]
+
+    def append(self, batch):
+        """Append the samples `batch` of shape `(n, *shape)`."""
+        n, n_new = self.n_samples, len(batch)
+
+        if self.format == "HDF5":
+            self.dataset.resize(n + n_new, axis=0)
+
+        self.dataset[n : n + n_new, ...] = batch
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _open_h5(self, shape, dtype, compression, compression_opts, chunks):
+        import h5py
+
+        self.file = h5py.File(self.filename, "a")
+
+        if self.key in self.file:
+            self.dataset = self.file[self.key]
+            return False
+
+        else:
+            self.dataset = self.file.create_dataset(
+                self.key,
+                shape=(0,) + shape,
+                maxshape=(None,) + shape,
+                dtype=dtype,
+                chunks=chunks,
+                compression=compression,
+                compression_opts=compression_opts,
+                shuffle=compression is not None,
+            )
+            return True
+
+    def _open_nc(self, shape, dtype, compression, compression_opts, chunks):
+        import netCDF4
+
+        if compression not in ["gzip", None]:
+            raise ValueError(f"Unsupported compression for NetCDF. [{compression}]")
+
+        mode = "a" if os.path.exists(self.filename) else "w"
+        self.file = netCDF4.Dataset(self.filename, mode)
+
+        if self.key in self.file.variables:
+            self.dataset = self.file[self.key]
+            return False
+
+        else:
+            dims = [f"{self.key}_dim{k}" for k in range(len(shape) + 1)]
+            for dim, n in zip(dims, (None,) + shape):
+                self.file.createDimension(dim, n)
+
+            self.dataset = self.file.createVariable(
+                self.key,
+                dtype,
+                dims,
+                zlib=compression is not None,
+                complevel=4 if compression_opts is None else compression_opts,
+                shuffle=compression is not None,
+                chunksizes=chunks,
+            )
+            return True
+
+
+def write_array(filename, key, array, **kwargs):
+    """Write `array` such that further samples can be appended along axis 0.
+
+    Raises a `ValueError` if `key` already exists; use `ArrayAppender` to append
+    to it. The keyword arguments are passed to `ArrayAppender`.
+    """
+    import numpy as np
+
+    array = np.asarray(array)
+    shape, dtype = array.shape[1:], array.dtype
+
+    appender = ArrayAppender(
+        filename, key, shape=shape, dtype=dtype, exist_ok=False, **kwargs
+    )
+    with appender:
+        appender.append(array)
+
+
+def _auto_chunks(shape, itemsize, target_bytes):
+    """Chunks of as many complete samples of `shape` as fit into `target_bytes`.
+
+    If a single sample is too large, it's split along its largest axes.
+    """
+    import numpy as np
 
-def read_array_shape(filename, key):
-    import h5py
+    shape = list(shape)
+    while shape and np.prod(shape) * itemsize > target_bytes and max(shape) > 1:
+        k = int(np.argmax(shape))
+        shape[k] = (shape[k] + 1) // 2
 
-    with h5py.File(filename, "r") as h5:
-        return h5[key].shape
+    n_samples = max(1, target_bytes // max(int(np.prod(shape)) * itemsize, 1))
+    return (n_samples,) + tuple(shape)
 
 
 def read_something(filename, command, mode="r", **kwargs):
@@ -0,0 +1,137 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2021 ETH Zurich, Luc Grosheintz-Laval
+
+# Kernel density estimates of large samples. The samples are binned linearly
+# onto a uniform grid, which is then convolved with a Gaussian kernel by FFT.
+# This costs `O(N + M log M)` for `N` samples and `M` grid points, instead of
+# `O(N M)` for summing the kernels directly. Use
+#
+#     x, density = lmmr.kde.binned_kde(samples)
+#     x_bd = lmmr.grids.uniform_boundaries(x)
+#
+# to obtain the boundaries of the cells, e.g. for `pcolormesh`.
+
+import numpy as np
+
+from lmmr.index_magic import linear_binning
+
+
+def silverman_bandwidth(x):
+    """Silverman's rule of thumb for the bandwidth of a Gaussian KDE.
+
+    The spread of the data is estimated robustly as the minimum of the standard
+    deviation and the interquartile range divided by 1.349. If the data doesn't
+    spread in some dimension, e.g. because all samples are equal, the spread is
+    taken to be `1e-3 * max(|x|, 1)` instead.
+
+    Args:
+        x: Samples of shape `(n_samples, n_dims)`, or `(n_samples,)` in 1D.
+
+    Returns:
+        The bandwidth in each dimension.
+    """
+    x = np.asarray(x)
+    X = x.reshape(x.shape[0], -1)
+    n_samples, n_dims = X.shape
+
+    sigma = np.std(X, axis=0, ddof=1)
+    q75, q25 = np.percentile(X, [75.0, 25.0], axis=0)
+    iqr = (q75 - q25) / 1.349
+
+    spread = np.where(iqr > 0.0, np.minimum(sigma, iqr), sigma)
+    min_spread = 1e-3 * np.maximum(np.max(np.abs(X), axis=0), 1.0)
+    spread = np.where(spread > 0.0, spread, min_spread)
+    factor = (4.0 / (n_dims + 2.0)) ** (1.0 / (n_dims + 4.0))
+    h = factor * spread * n_samples ** (-1.0 / (n_dims + 4.0))
+
+    return h[0] if x.ndim == 1 else h
+
+
+def binned_kde(x, n_points=256, bandwidth=None, bounds=None, weights=None):
+    """Gaussian KDE of `x` evaluated on a uniform grid.
+
+    Args:
+        x: Samples of shape `(n_samples, n_dims)`, or `(n_samples,)` in 1D.
+        n_points: Number of grid points in each dimension.
+        bandwidth: Standard deviation of the kernel in each dimension. By
+            default, `silverman_bandwidth(x)`.
+        bounds: The grid spans `[lo, hi]` in each dimension, given as a list of
+            pairs `(lo, hi)`. By default the range of the data, extended by three
+            bandwidths on either side. Samples outside the bounds are ignored,
+            i.e. the density is normalized over the bounds.
+        weights: Weight of each sample; by default one.
+
+    Returns:
+        The grid points and the density on the grid. In 1D, the grid points are
+        an array, otherwise a list of arrays, one per dimension.
+    """
+    x = np.asarray(x)
+    X = x.reshape(x.shape[0], -1)
+    n_dims = X.shape[1]
+
+    if bandwidth is None:
+        bandwidth = silverman_bandwidth(X)
+    bandwidth = np.broadcast_to(np.asarray(bandwidth, dtype=float), (n_dims,))
+
+    if np.any(bandwidth <= 0.0):
+        raise ValueError("The bandwidth must be positive.")
+
+    if bounds is None:
+        lo, hi = np.min(X, axis=0), np.max(X, axis=0)
+        bounds = list(zip(lo - 3.0 * bandwidth, hi + 3.0 * bandwidth))
+    else:
+        if x.ndim == 1 and np.isscalar(bounds[0]):
+            bounds = [bounds]
+
+        # `linear_binning` would move these samples onto the boundary.
+        lo, hi = np.array(bounds, dtype=float).T
+        is_inside = np.all(np.logical_and(lo <= X, X <= hi), axis=1)
+        X = X[is_inside]
+
+        if weights is not None:
+            weights = np.asarray(weights)[is_inside]
+
+    n_points = np.broadcast_to(n_points, (n_dims,))
+    centers = [np.linspace(lo, hi, n) for (lo, hi), n in zip(bounds, n_points)]
+
+    counts = linear_binning(X, centers, weights=weights)
+    density = _convolve(counts, _gaussian_kernel(centers, bandwidth))
+    density = np.maximum(density, 0.0) / np.sum(counts)
+
+    if x.ndim == 1:
+        return centers[0], density
+
+    return centers, density
+
+
+def _gaussian_kernel(centers, bandwidth):
+    """Tensor product Gaussian kernel sampled on the grid spacing.
+
+    The sampled kernel is normalized such that it sums to `1 / prod(dx)`, which
+    matters if the bandwidth isn't large compared to the grid spacing.
+    """
+    kernel = np.ones(())
+    for c, h in zip(centers, bandwidth):
+        dx = c[1] - c[0]
+        n_half = min(c.size - 1, int(np.ceil(4.0 * h / dx)))
+
+        z = np.arange(-n_half, n_half + 1) * dx / h
+        k = np.exp(-0.5 * z ** 2)
+        k /= np.sum(k) * dx
+
+        kernel = np.multiply.outer(kernel, k)
+
+    return kernel
+
+
+def _convolve(a, kernel):
+    """The part of the linear convolution of `a` and `kernel` aligned with `a`."""
+    n_half = [(k - 1) // 2 for k in kernel.shape]
+    shape = [n + k - 1 for n, k in zip(a.shape, kernel.shape)]
+    axes = tuple(range(a.ndim))
+
+    a_hat = np.fft.rfftn(a, s=shape, axes=axes)
+    kernel_hat = np.fft.rfftn(kernel, s=shape, axes=axes)
+    full = np.fft.irfftn(a_hat * kernel_hat, s=shape, axes=axes)
+
+    return full[tuple(slice(m, m + n) for m, n in zip(n_half, a.shape))]
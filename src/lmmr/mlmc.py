@@ -0,0 +1,211 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2021 ETH Zurich, Luc Grosheintz-Laval
+
+import time
+import functools
+
+import numpy as np
+
+import lmmr.parallel
+from lmmr.io.convergence_plots import compute_rates
+from lmmr.utilities import merge_moments
+
+
+class MLMC:
+    """Multilevel Monte Carlo estimate of `E[P_L]`.
+
+    The `sampler(level, n_samples)` returns `n_samples` independent samples of
+    `Y_l = P_l - P_{l-1}`, or `P_0` on level 0, as an array of shape
+    `(n_samples,)`.
+
+    Typical usage:
+        mlmc = MLMC(sampler)
+        estimate = mlmc.run(rmse=1e-3)
+
+        resolutions, errors, rates = mlmc.convergence_data()
+        table = LatexConvergenceTable(errors, rates, resolutions, labels)
+
+    The cost per sample of each level is `costs(level)`, if given; otherwise,
+    it's measured. The weak convergence rate `alpha`, i.e. `|E[Y_l]| ~ 2**(-alpha
+    l)`, is estimated from the samples unless given.
+
+    If an `executor` is given, the samples of each batch are drawn concurrently,
+    see `lmmr.parallel.draw_chunks`.
+
+    See Giles (2008), https://doi.org/10.1287/opre.1070.0496
+    """
+
+    def __init__(
+        self,
+        sampler,
+        costs=None,
+        alpha=None,
+        n_pilot=100,
+        min_levels=3,
+        max_levels=10,
+        executor=None,
+    ):
+        self.sampler = sampler
+        self.costs = costs
+        self.alpha = alpha
+        self.n_pilot = n_pilot
+        self.min_levels = min_levels
+        self.max_levels = max_levels
+        self.executor = executor
+
+        self.n_samples = np.zeros(0, dtype=np.int64)
+        self.means = np.zeros(0)
+        self.M2 = np.zeros(0)
+        self.times = np.zeros(0)
+
+        self.converged = False
+
+    @property
+    def n_levels(self):
+        return self.n_samples.size
+
+    @property
+    def variances(self):
+        """The sample variance of `Y_l` on each level."""
+        return self.M2 / np.maximum(self.n_samples - 1, 1)
+
+    @property
+    def cost_per_sample(self):
+        levels = range(self.n_levels)
+
+        if self.costs is None:
+            return self.times / self.n_samples
+        else:
+            return np.array([self.costs(level) for level in levels], dtype=float)
+
+    @property
+    def estimate(self):
+        return np.sum(self.means)
+
+    def bias(self):
+        """Estimate of the bias `|E[P - P_L]|`."""
+        alpha = self._alpha()
+        return np.abs(self.means[-1]) / (2.0 ** alpha - 1.0)
+
+    def rmse(self):
+        """Estimate of the root mean squared error of `estimate`."""
+        return np.sqrt(np.sum(self.variances / self.n_samples) + self.bias() ** 2)
+
+    def optimal_n_samples(self, rmse):
+        """The number of samples per level, which minimizes the total cost.
+
+        Half of `rmse**2` is spent on the variance and half on the bias.
+        """
+        V, C = self.variances, self.cost_per_sample
+        N = 2.0 / rmse ** 2 * np.sqrt(V / C) * np.sum(np.sqrt(V * C))
+
+        return np.ceil(N).astype(np.int64)
+
+    def add_samples(self, level, n_samples):
+        """Draw `n_samples` samples on `level` and update the statistics."""
+
+        if level == self.n_levels:
+            self._add_level()
+
+        t0 = time.perf_counter()
+        sampler = functools.partial(self.sampler, level)
+        Y = lmmr.parallel.draw_chunks(sampler, n_samples, self.executor)
+        t1 = time.perf_counter()
+
+        mean = np.mean(Y)
+        level_statistics = self.n_samples[level], self.means[level], self.M2[level]
+        new_statistics = n_samples, mean, np.sum((Y - mean) ** 2)
+
+        n, mean, M2 = merge_moments(level_statistics, new_statistics)
+        self.n_samples[level], self.means[level], self.M2[level] = n, mean, M2
+        self.times[level] += t1 - t0
+
+    def run(self, rmse):
+        """Add samples and levels until the estimated error is below `rmse`.
+
+        On each level, at most as many samples as it already has are added per
+        iteration, such that the estimates of the variance and cost improve
+        before the bulk of the samples is drawn. Whether the error estimate
+        is below `rmse` before `max_levels` is reached is stored in
+        `converged`.
+
+        Returns the MLMC estimate.
+        """
+
+        while self.n_levels < self.min_levels:
+            self.add_samples(self.n_levels, self.n_pilot)
+
+        self.converged = False
+
+        while not self.converged:
+            n_extra = self.optimal_n_samples(rmse) - self.n_samples
+            n_extra = np.minimum(n_extra, np.maximum(self.n_samples, self.n_pilot))
+
+            for level in np.flatnonzero(n_extra > 0):
+                self.add_samples(level, n_extra[level])
+
+            if np.any(n_extra > 0):
+                continue
+
+            if self.bias() <= rmse / np.sqrt(2.0):
+                self.converged = True
+
+            elif self.n_levels < self.max_levels:
+                self.add_samples(self.n_levels, self.n_pilot)
+
+            else:
+                break
+
+        return self.estimate
+
+    def statistics(self):
+        """The statistics of each level as a dictionary of arrays."""
+        return {
+            "level": np.arange(self.n_levels),
+            "n_samples": self.n_samples.copy(),
+            "mean": self.means.copy(),
+            "variance": self.variances,
+            "cost": self.cost_per_sample,
+        }
+
+    def convergence_data(self, resolutions=None):
+        """The convergence of `|E[Y_l]|` and `V[Y_l]` for levels `l >= 1`.
+
+        Returns `resolutions, errors, rates` in the format expected by
+        `LatexConvergenceTable` and `SplitConvergencePlot.add`. By default the
+        resolution of level `l` is `2**l`. The rates are computed with respect
+        to `1 / resolutions`, i.e. they're positive if the errors decrease.
+        """
+        levels = np.arange(1, self.n_levels)
+        if resolutions is None:
+            resolutions = 2 ** levels
+        else:
+            resolutions = np.asarray(resolutions)[levels]
+
+        errors = [np.abs(self.means[levels]), self.variances[levels]]
+        rates = [compute_rates(1.0 / resolutions, err) for err in errors]
+
+        return resolutions, errors, rates
+
+    def _add_level(self):
+        self.n_samples = np.append(self.n_samples, 0)
+        self.means = np.append(self.means, 0.0)
+        self.M2 = np.append(self.M2, 0.0)
+        self.times = np.append(self.times, 0.0)
+
+    def _alpha(self):
+        if self.alpha is not None:
+            return self.alpha
+
+        # Fit `log2 |E[Y_l]| = -alpha l + c` on the levels `l >= 1`, except
+        # those with a mean of exactly zero.
+        levels = np.arange(1, self.n_levels)
+        levels = levels[self.means[levels] != 0.0]
+        if levels.size < 2:
+            return 0.5
+
+        log_means = np.log2(np.abs(self.means[levels]))
+        alpha = -np.polyfit(levels, log_means, 1)[0]
+
+        # Avoid a meaningless bias estimate from noisy means.
+        return np.fmax(alpha, 0.5)
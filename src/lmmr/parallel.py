@@ -0,0 +1,224 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2021 ETH Zurich, Luc Grosheintz-Laval
+
+# Evaluate functions on chunks of samples with any `concurrent.futures.Executor`.
+# Samples are either one array or a tuple or dict of arrays, with the different
+# samples on axis 0. For process pools, the samples and results are passed through
+# shared memory instead of being pickled.
+
+import os
+import concurrent.futures
+
+import numpy as np
+
+import lmmr.random
+
+
+def chunk_bounds(n, n_chunks):
+    """Split `range(n)` into at most `n_chunks` contiguous, non-empty parts."""
+    edges = [k * n // n_chunks for k in range(n_chunks + 1)]
+    return [(lo, hi) for lo, hi in zip(edges[:-1], edges[1:]) if lo < hi]
+
+
+def map_chunks(f, samples, executor=None, n_chunks=None):
+    """Evaluate `f(samples)` concurrently on chunks of `samples`.
+
+    The samples are split along axis 0 into `n_chunks` chunks, by default one
+    per core. The results are concatenated in the order of the samples.
+    Without an `executor` this is simply `f(samples)`.
+    """
+    n_samples = len(next(iter(_leaves(samples))))
+    if executor is None or n_samples == 0:
+        return f(samples)
+
+    bounds = chunk_bounds(n_samples, _with_default_chunks(n_chunks))
+
+    if not isinstance(executor, concurrent.futures.ProcessPoolExecutor):
+        futures = [executor.submit(f, _slice(samples, lo, hi)) for lo, hi in bounds]
+        return _concatenate([future.result() for future in futures])
+
+    handles, descriptor = _export(samples, track=True)
+    try:
+        futures = [
+            executor.submit(_evaluate_shared, f, descriptor, lo, hi)
+            for lo, hi in bounds
+        ]
+        return _collect(futures)
+
+    finally:
+        _release(handles)
+
+
+def draw_chunks(rng, n_samples, executor=None, n_chunks=None):
+    """Draw `rng(n_samples)` concurrently in chunks.
+
+    Each chunk is drawn with its own stream of `lmmr.random`, spawned from
+    the global one. Therefore, if `rng` uses `lmmr.random`, the samples only
+    depend on the seed and `n_chunks`, but not on which worker draws which
+    chunk.
+    """
+    if executor is None or n_samples == 0:
+        return rng(n_samples)
+
+    bounds = chunk_bounds(n_samples, _with_default_chunks(n_chunks))
+    seeds = lmmr.random.spawn(len(bounds))
+
+    if not isinstance(executor, concurrent.futures.ProcessPoolExecutor):
+        futures = [
+            executor.submit(_draw, rng, hi - lo, seed)
+            for (lo, hi), seed in zip(bounds, seeds)
+        ]
+        return _concatenate([future.result() for future in futures])
+
+    futures = [
+        executor.submit(_draw_shared, rng, hi - lo, seed)
+        for (lo, hi), seed in zip(bounds, seeds)
+    ]
+    return _collect(futures)
+
+
+def _with_default_chunks(n_chunks):
+    return os.cpu_count() if n_chunks is None else n_chunks
+
+
+def _apply(func, *samples):
+    """Apply `func` to the arrays of one or more sample containers."""
+    if isinstance(samples[0], tuple):
+        return tuple(func(*arrays) for arrays in zip(*samples))
+    elif isinstance(samples[0], dict):
+        return {key: func(*(s[key] for s in samples)) for key in samples[0]}
+    else:
+        return func(*samples)
+
+
+def _leaves(samples):
+    if isinstance(samples, tuple):
+        return samples
+    elif isinstance(samples, dict):
+        return tuple(samples.values())
+    else:
+        return (samples,)
+
+
+def _slice(samples, lo, hi):
+    return _apply(lambda s: s[lo:hi], samples)
+
+
+def _concatenate(chunks):
+    if isinstance(chunks[0], tuple):
+        return tuple(np.concatenate(parts) for parts in zip(*chunks))
+    elif isinstance(chunks[0], dict):
+        return {key: np.concatenate([c[key] for c in chunks]) for key in chunks[0]}
+    else:
+        return np.concatenate(chunks)
+
+
+def _export(samples, track):
+    """Copy `samples` to shared memory.
+
+    Returns the handles of the shared memory and a picklable descriptor.
+    """
+    from multiprocessing import shared_memory, resource_tracker
+
+    handles = []
+
+    def export(a):
+        a = np.asarray(a)
+        shm = shared_memory.SharedMemory(create=True, size=max(a.nbytes, 1))
+        np.ndarray(a.shape, a.dtype, buffer=shm.buf)[...] = a
+
+        if not track:
+            # Ownership passes to the process which attaches to it.
+            resource_tracker.unregister(shm._name, "shared_memory")
+
+        handles.append(shm)
+        return shm.name, a.shape, a.dtype.str
+
+    descriptor = _apply(export, samples)
+    return tuple(handles), descriptor
+
+
+def _attach(descriptor):
+    """Attach to shared memory created by `_export`."""
+    from multiprocessing import shared_memory
+
+    handles = []
+
+    def attach(d):
+        name, shape, dtype = d
+        shm = shared_memory.SharedMemory(name=name)
+        handles.append(shm)
+        return np.ndarray(shape, dtype, buffer=shm.buf)
+
+    if isinstance(descriptor, tuple) and isinstance(descriptor[0], str):
+        samples = attach(descriptor)
+    else:
+        samples = _apply(attach, descriptor)
+
+    return tuple(handles), samples
+
+
+def _release(handles, unlink=True):
+    if unlink:
+        for shm in handles:
+            shm.unlink()
+
+    for shm in handles:
+        shm.close()
+
+
+def _evaluate_shared(f, descriptor, lo, hi):
+    handles, samples = _attach(descriptor)
+    try:
+        result = f(_slice(samples, lo, hi))
+
+        # The result may be a view of the samples; export it before closing.
+        result_handles, result_descriptor = _export(result, track=False)
+        del result
+
+        _release(result_handles, unlink=False)
+
+    finally:
+        del samples
+        _release(handles, unlink=False)
+
+    return result_descriptor
+
+
+def _draw(rng, n_samples, seed):
+    with lmmr.random.stream(seed):
+        return rng(n_samples)
+
+
+def _draw_shared(rng, n_samples, seed):
+    handles, descriptor = _export(_draw(rng, n_samples, seed), track=False)
+    _release(handles, unlink=False)
+
+    return descriptor
+
+
+def _collect(futures):
+    """Concatenate the results, in shared memory, of `futures` in order.
+
+    Waits for all `futures` and unlinks the shared memory of every result,
+    even if some of them failed; then re-raises the first failure.
+    """
+    concurrent.futures.wait(futures)
+
+    handles, chunks = [], []
+    try:
+        for future in futures:
+            if not future.cancelled() and future.exception() is None:
+                h, chunk = _attach(future.result())
+                handles.append(h)
+                chunks.append(chunk)
+
+        for future in futures:
+            future.result()
+
+        return _concatenate(chunks)
+
+    finally:
+        del chunks
+        for h in handles:
+            _release(h)
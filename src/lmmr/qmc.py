@@ -1,9 +1,107 @@
 # SPDX-License-Identifier: MIT
 # Copyright (c) 2021 ETH Zurich, Luc Grosheintz-Laval
 
+import os
+import functools
+import hashlib
+import tempfile
+
 import numpy as np
 
-from sobol import i4_sobol
+import lmmr.io
+import lmmr.parallel
+import lmmr.random
+from lmmr.utilities import merge_moments
+
+
+# Primitive polynomials and initial direction numbers of the first 40
+# dimensions, see Bratley & Fox (1988), https://doi.org/10.1145/42288.214372
+_SOBOL_POLYNOMIALS = [
+    1,   3,   7,   11,  13,  19,  25,  37,  59,  47,
+    61,  55,  41,  67,  97,  91,  109, 103, 115, 131,
+    193, 137, 145, 143, 241, 157, 185, 167, 229, 171,
+    213, 191, 253, 203, 211, 239, 247, 285, 369, 299,
+]  # fmt: skip
+
+_SOBOL_INITIAL_NUMBERS = [
+    [],
+    [1],
+    [1, 1],
+    [1, 3, 7],
+    [1, 1, 5],
+    [1, 3, 1, 1],
+    [1, 1, 3, 7],
+    [1, 3, 3, 9, 9],
+    [1, 3, 7, 13, 3],
+    [1, 1, 5, 11, 27],
+    [1, 3, 5, 1, 15],
+    [1, 1, 7, 3, 29],
+    [1, 3, 7, 7, 21],
+    [1, 1, 1, 9, 23, 37],
+    [1, 3, 3, 5, 19, 33],
+    [1, 1, 3, 13, 11, 7],
+    [1, 1, 7, 13, 25, 5],
+    [1, 3, 5, 11, 7, 11],
+    [1, 1, 1, 3, 13, 39],
+    [1, 3, 1, 15, 17, 63, 13],
+    [1, 1, 5, 5, 1, 27, 33],
+    [1, 3, 3, 3, 25, 17, 115],
+    [1, 1, 3, 15, 29, 15, 41],
+    [1, 3, 1, 7, 3, 23, 79],
+    [1, 3, 7, 9, 31, 29, 17],
+    [1, 1, 5, 13, 11, 3, 29],
+    [1, 3, 1, 9, 5, 21, 119],
+    [1, 1, 3, 1, 23, 13, 75],
+    [1, 3, 3, 11, 27, 31, 73],
+    [1, 1, 7, 7, 19, 25, 105],
+    [1, 3, 5, 5, 21, 9, 7],
+    [1, 1, 1, 15, 5, 49, 59],
+    [1, 1, 1, 1, 1, 33, 65],
+    [1, 3, 5, 15, 17, 19, 21],
+    [1, 1, 7, 11, 13, 29, 3],
+    [1, 3, 7, 5, 7, 11, 113],
+    [1, 1, 5, 3, 15, 19, 61],
+    [1, 3, 1, 1, 9, 27, 89, 7],
+    [1, 1, 3, 7, 31, 15, 45, 23],
+    [1, 3, 3, 9, 9, 25, 107, 39],
+]
+
+# Generating vector of an embedded rank-1 lattice rule for up to 2**20 points,
+# the first 250 components of `lattice-33002-1024-1048576.9125` from
+# https://web.maths.unsw.edu.au/~fkuo/lattice/, see Cools, Kuo, Nuyens (2006),
+# https://doi.org/10.1137/06065074X
+_LATTICE_GENERATING_VECTOR = [
+         1, 182667, 213731, 255351,  96013, 116671, 479315, 424089, 271103, 464421,
+    124483, 230887, 392877, 162965, 109125, 168491, 216103,   5613, 207895, 506745,
+    189519, 114879, 133967, 374257, 254597, 502087, 298245, 191333, 242099, 285991,
+    397887, 507051, 511437, 129779, 406987, 345291, 225123, 511175, 432153, 306191,
+    116577,    809, 370175, 402615, 485791, 201053, 366959,  54087, 395609, 211615,
+     68543, 443345, 327293, 290819, 278623, 362043, 236117,  11091, 216837,  31545,
+    325799, 503877, 410523,  88371, 240077, 423807, 479855, 330835, 134517, 329989,
+    473381,  59205, 337775, 355995, 372243, 279827, 367217, 277741, 267077, 417971,
+    152599, 184949, 511773, 397077, 520041,  98063,  52983,  91233, 363069,  23829,
+    424377, 225285, 171171, 496765, 352791, 223231, 253273, 296195, 273379, 407265,
+    305849, 215121, 489851, 245893, 397947, 174723, 329797, 213325, 357759, 346031,
+    131433, 110731, 487615, 371877, 330799, 124595,  48775, 273275, 405083, 436731,
+    465257, 158265,  82033,  67805, 203565, 190785, 351165,  19555, 210139, 236211,
+    197333, 217457, 437623, 304987, 461169, 470529, 457011,  91823,  40575, 513857,
+    238575, 149779, 163017, 355521, 438395, 429151, 510607, 252661, 255753, 219989,
+    146583, 138783, 262887,  22765, 313675, 329005, 198699, 239305, 416211, 305549,
+    185961, 343313, 485961, 333207, 400975, 334381, 317357, 270221, 175403, 179303,
+    341251,  11983, 497027, 145741, 431637,  27489, 460319, 288665, 178737, 120329,
+     99851,  97789, 446355, 398323, 320921, 399735, 301009,  58221,  20499, 496019,
+    201021,  18141, 401811,   7615,  13797,  56685,  35433, 143763, 221013, 111635,
+    398843, 450531, 503423,  37261, 130555, 159743, 114359, 283841, 168217, 148271,
+     69501, 450607, 283473,  13641, 443385, 338995,   8113,  30043, 442875, 502897,
+    336337, 110527, 514381, 200349,  27787,  38955, 214547, 231515, 315083, 458703,
+    136455,  23359, 247081, 448209, 421023, 417125, 314287, 335073, 315409, 131405,
+    495049, 459151, 444599, 458887,  36639, 512851, 431191, 257755, 336191,  80771,
+]  # fmt: skip
+
+_SOBOL_MAX_DIMS = len(_SOBOL_POLYNOMIALS)
+_SOBOL_BITS = 30
+_SOBOL_BLOCK_SIZE = 2 ** 16
+_LATTICE_BITS = 20
 
 
 def unit_box(n_dims):
@@ -19,42 +117,742 @@ def rescale(points, domain):
     return x0 + points * (x1 - x0)
 
 
+def _sobol_direction_numbers():
+    """The direction numbers, `V[j, i]` is the `j`-th bit of dimension `i`.
+
+    The table is computed once and reused by every subsequent call.
+    """
+    if not hasattr(_sobol_direction_numbers, "_V"):
+        V = np.zeros((_SOBOL_BITS, _SOBOL_MAX_DIMS), dtype=np.uint64)
+        V[:, 0] = 1
+
+        for i in range(1, _SOBOL_MAX_DIMS):
+            poly = _SOBOL_POLYNOMIALS[i]
+            m = poly.bit_length() - 1
+            V[:m, i] = _SOBOL_INITIAL_NUMBERS[i]
+
+            for j in range(m, _SOBOL_BITS):
+                v = int(V[j - m, i])
+                for k in range(1, m + 1):
+                    if (poly >> (m - k)) & 1:
+                        v ^= int(V[j - k, i]) << k
+
+                V[j, i] = v
+
+        shifts = np.arange(_SOBOL_BITS - 1, -1, -1, dtype=np.uint64)
+        V <<= shifts[:, np.newaxis]
+        V.setflags(write=False)
+
+        _sobol_direction_numbers._V = V
+
+    return _sobol_direction_numbers._V
+
+
+def _lowest_zero_bit(k):
+    """Position of the lowest zero bit of each element of `k`."""
+    _, exponent = np.frexp((~k & (k + np.uint64(1))).astype(np.float64))
+    return exponent - 1
+
+
+def _sobol_integers(n_dims, n_samples, offset=0, V=None):
+    """The Sobol points `offset, ..., offset + n_samples - 1` as integers.
+
+    The first point is computed directly from the Gray code of `offset`, all
+    others by the Gray code recurrence
+
+        x[k+1] = x[k] ^ V[lowest_zero_bit(k)].
+
+    Optionally, the direction numbers `V` can be passed explicitly. They have
+    shape `(..., _SOBOL_BITS, n_dims)`, leading axes are carried over to the
+    points, which have shape `(..., n_samples, n_dims)`.
+    """
+    if not 1 <= n_dims <= _SOBOL_MAX_DIMS:
+        raise ValueError(
+            f"Sobol points need 1 <= n_dims <= {_SOBOL_MAX_DIMS}. [{n_dims}]"
+        )
+
+    if offset < 0 or offset + n_samples > 2 ** _SOBOL_BITS:
+        raise ValueError(
+            f"Sobol points are limited to the first 2**{_SOBOL_BITS} points."
+        )
+
+    if V is None:
+        V = _sobol_direction_numbers()[:, :n_dims]
+
+    points = np.empty(V.shape[:-2] + (n_samples, n_dims), dtype=np.uint64)
+    if n_samples == 0:
+        return points
+
+    gray_code = offset ^ (offset >> 1)
+    bits = [j for j in range(_SOBOL_BITS) if (gray_code >> j) & 1]
+    points[..., 0, :] = np.bitwise_xor.reduce(V[..., bits, :], axis=-2)
+
+    k = np.arange(offset, offset + n_samples - 1, dtype=np.uint64)
+    points[..., 1:, :] = V[..., _lowest_zero_bit(k), :]
+
+    return np.bitwise_xor.accumulate(points, axis=-2, out=points)
+
+
+def _sobol_unit_points(n_dims, n_samples, offset=0):
+    """The Sobol points `offset, ..., offset + n_samples - 1` in the unit cube."""
+    points = np.empty((n_samples, n_dims))
+
+    for k in range(0, n_samples, _SOBOL_BLOCK_SIZE):
+        n_block = min(_SOBOL_BLOCK_SIZE, n_samples - k)
+        block = _sobol_integers(n_dims, n_block, offset=offset + k)
+        np.multiply(block, 2.0 ** -_SOBOL_BITS, out=points[k : k + n_block])
+
+    return points
+
+
+def _as_domain(domain):
+    return unit_box(domain) if type(domain) == int else domain
+
+
 def sobol_points(domain, n_samples, seed=0):
     """Generate the `n_samples` Sobol points."""
 
-    if type(domain) == int:
-        domain = unit_box(domain)
+    domain = _as_domain(domain)
+    return rescale(_sobol_unit_points(len(domain), n_samples, seed), domain)
+
+
+def iter_sobol_points(domain, n_samples, chunk_size, seed=0):
+    """Generate the `n_samples` Sobol points in chunks of `chunk_size`.
+
+    Concatenating the chunks results in `sobol_points(domain, n_samples, seed)`.
+    Only one chunk is held in memory at any time. Since any point of the
+    sequence can be computed directly, `seed` costs nothing and can be used to
+    give every worker its own disjoint part of the sequence, e.g.
+
+        n_local = n_samples // n_ranks
+        for x in iter_sobol_points(domain, n_local, chunk_size, seed=rank * n_local):
+            ...
+    """
+
+    domain = _as_domain(domain)
+    n_dims = len(domain)
+
+    for k in range(0, n_samples, chunk_size):
+        n_chunk = min(chunk_size, n_samples - k)
+        yield rescale(_sobol_unit_points(n_dims, n_chunk, seed + k), domain)
+
+
+def _parity(x):
+    """The parity of the number of set bits of each element of `x`."""
+    for shift in [32, 16, 8, 4, 2, 1]:
+        x = x ^ (x >> np.uint64(shift))
+
+    return x & np.uint64(1)
+
+
+def _hash(x):
+    """A 64-bit integer hash, the finalizer of SplitMix64."""
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def _random_integers(rng, shape, n_bits):
+    return rng.integers(0, 2 ** n_bits, size=shape, dtype=np.uint64)
+
+
+def _linear_matrix_scramble(V, rng, n_replicates):
+    """Direction numbers `L @ V` for random, lower triangular binary `L`.
+
+    There is one matrix per replicate and dimension. The result has shape
+    `(n_replicates, _SOBOL_BITS, n_dims)`.
+    """
+    n_dims = V.shape[-1]
+
+    # Row `k` of `L` as a bit mask: the diagonal is set, the bits above it
+    # (i.e. more significant ones) are random.
+    positions = np.arange(_SOBOL_BITS - 1, -1, -1, dtype=np.uint64)
+    below = (np.uint64(2) << positions) - np.uint64(1)
+    diagonal = np.uint64(1) << positions
+
+    random_bits = _random_integers(rng, (n_replicates, n_dims, _SOBOL_BITS), 30)
+    L = (random_bits & ~below) | diagonal
+
+    LV = _parity(L[:, np.newaxis, :, :] & V[np.newaxis, :, :, np.newaxis])
+    return np.bitwise_or.reduce(LV << positions, axis=-1)
+
+
+def _owen_scramble(points, keys):
+    """Nested uniform scrambling of the integer `points`.
+
+    Bit `k` of a point is flipped depending on its `k` leading bits. The flips
+    are pseudo-random bits computed by hashing the node of the binary tree
+    together with `keys`, which has one key per replicate and dimension.
+
+    See Owen (1995), https://doi.org/10.1007/978-1-4612-2552-2_19
+    """
+    n_replicates, n_samples, n_dims = points.shape
+    scrambled = points.copy()
+
+    # All bits are processed per block, which must fit into the cache.
+    block_size = max(1, 2 ** 14 // n_dims)
+
+    for r in range(n_replicates):
+        for lo in range(0, n_samples, block_size):
+            x = points[r, lo : lo + block_size]
+            x_scrambled = scrambled[r, lo : lo + block_size]
+
+            for k in range(_SOBOL_BITS):
+                position = np.uint64(_SOBOL_BITS - 1 - k)
+                node = (x >> (position + np.uint64(1))) | np.uint64(1 << k)
+                flip = _hash(node ^ keys[r]) >> np.uint64(63)
+                x_scrambled ^= flip << position
+
+    return scrambled
+
+
+def scrambled_sobol_points(
+    domain, n_samples, n_replicates, scramble="owen", seed=0, rng=None
+):
+    """Generate `n_replicates` independently scrambled sets of Sobol points.
+
+    The result has shape `(n_replicates, n_samples, n_dims)`. Each replicate
+    is a randomization of `sobol_points(domain, n_samples, seed)` by either:
+
+        "owen": nested uniform scrambling;
+        "linear": random linear matrix scrambling followed by a digital shift;
+        "shift": a random digital shift.
+
+    The randomness is drawn from `rng`, by default `lmmr.random.global_rng()`.
+    Use `rqmc_mean` to compute the estimate and its error from the values of
+    the integrand on these points.
+    """
+
+    domain = _as_domain(domain)
+    n_dims = len(domain)
+    rng = lmmr.random.global_rng() if rng is None else rng
+
+    V = _sobol_direction_numbers()[:, :n_dims]
+    if scramble == "linear":
+        V = _linear_matrix_scramble(V, rng, n_replicates)
+    else:
+        V = np.broadcast_to(V, (n_replicates,) + V.shape)
+
+    points = _sobol_integers(n_dims, n_samples, offset=seed, V=V)
+
+    if scramble == "owen":
+        keys = _random_integers(rng, (n_replicates, n_dims), 64)
+        points = _owen_scramble(points, keys)
+
+    elif scramble in ["linear", "shift"]:
+        points ^= _random_integers(rng, (n_replicates, 1, n_dims), _SOBOL_BITS)
+
+    else:
+        raise ValueError(f"Unknown scrambling. [{scramble}]")
+
+    return rescale(points * 2.0 ** -_SOBOL_BITS, domain)
+
+
+def rqmc_mean(values):
+    """The randomized QMC estimate of the mean and its standard error.
+
+    The `values` of the integrand have the replicates on axis 0 and the
+    samples on axis 1, e.g. `values = f(x)` for `x = scrambled_sobol_points(...)`
+    if `f` maps the last axis to a scalar.
+    """
+    n_replicates = values.shape[0]
+    means = np.mean(values, axis=1)
+
+    mean = np.mean(means, axis=0)
+    error = np.std(means, axis=0, ddof=1) / np.sqrt(n_replicates)
+
+    return mean, error
+
+
+def _radical_inverse_base2(k, n_bits):
+    """Reverse the `n_bits` lowest bits of `k`."""
+    k = np.asarray(k, dtype=np.uint64)
+    reversed_k = np.zeros_like(k)
+
+    for j in range(n_bits):
+        bit = (k >> np.uint64(j)) & np.uint64(1)
+        reversed_k |= bit << np.uint64(n_bits - 1 - j)
+
+    return reversed_k
+
+
+def lattice_points(domain, n_samples, seed=0, shift=None):
+    """Generate `n_samples` points of a rank-1 lattice rule.
+
+    The points are ordered such that the first `2**m` points are the lattice
+    rule with `2**m` points. Like for `sobol_points`, `seed` is the index of
+    the first point. The lattice is shifted by `shift`, e.g. a random shift
+
+        shift = lmmr.random.uniform(size=n_dims)
+    """
+    domain = _as_domain(domain)
+    n_dims = len(domain)
+
+    if n_dims > len(_LATTICE_GENERATING_VECTOR):
+        raise ValueError(
+            "Lattice points need n_dims <= "
+            f"{len(_LATTICE_GENERATING_VECTOR)}. [{n_dims}]"
+        )
+
+    if seed < 0 or seed + n_samples > 2 ** _LATTICE_BITS:
+        raise ValueError(
+            f"Lattice points are limited to the first 2**{_LATTICE_BITS} points."
+        )
+
+    z = np.array(_LATTICE_GENERATING_VECTOR[:n_dims], dtype=np.uint64)
+    k = _radical_inverse_base2(np.arange(seed, seed + n_samples), _LATTICE_BITS)
+
+    mask = np.uint64(2 ** _LATTICE_BITS - 1)
+    points = ((k[:, np.newaxis] * z) & mask) * 2.0 ** -_LATTICE_BITS
+
+    if shift is not None:
+        points = np.mod(points + shift, 1.0)
+
+    return rescale(points, domain)
+
+
+def _primes(n):
+    """The first `n` prime numbers."""
+    primes = []
+    candidate = 2
+
+    while len(primes) < n:
+        if all(candidate % p != 0 for p in primes if p * p <= candidate):
+            primes.append(candidate)
+        candidate += 1
+
+    return primes
+
 
+def _halton_n_digits(base):
+    # Enough digits to resolve double precision.
+    return int(np.ceil(53 * np.log(2) / np.log(base)))
+
+
+def halton_permutations(n_dims, rng=None):
+    """Random digit permutations to scramble Halton points.
+
+    There is one permutation per dimension and digit. The randomness is drawn
+    from `rng`, by default `lmmr.random.global_rng()`.
+    """
+    rng = lmmr.random.global_rng() if rng is None else rng
+
+    return [
+        np.array([rng.permutation(base) for _ in range(_halton_n_digits(base))])
+        for base in _primes(n_dims)
+    ]
+
+
+def halton_points(domain, n_samples, seed=0, permutations=None):
+    """Generate `n_samples` Halton points.
+
+    Like for `sobol_points`, `seed` is the index of the first point. The
+    points are scrambled if `permutations` are given, see
+    `halton_permutations`.
+    """
+    domain = _as_domain(domain)
     n_dims = len(domain)
-    points = np.array([i4_sobol(n_dims, k + seed)[0] for k in range(n_samples)])
+
+    k = np.arange(seed, seed + n_samples, dtype=np.int64)
+    points = np.zeros((n_samples, n_dims))
+
+    for i, base in enumerate(_primes(n_dims)):
+        if permutations is None:
+            n_digits = int(np.ceil(np.log(max(seed + n_samples, 2)) / np.log(base)))
+        else:
+            n_digits = _halton_n_digits(base)
+
+        digits = k
+        for j in range(n_digits):
+            digits, digit = np.divmod(digits, base)
+            if permutations is not None:
+                digit = permutations[i][j, digit]
+
+            points[:, i] += digit * float(base) ** -(j + 1)
 
     return rescale(points, domain)
 
 
-def sobol_variances(f, n_params, n_samples, indices):
+class PointSetCache:
+    """Persistent cache of point sets, e.g. Sobol points.
+
+    The point sets are stored as `.npy` files in `directory` and returned as
+    read-only memory mapped arrays. Therefore, all processes on a node share
+    the same pages of the page cache. Typical usage:
+
+        cache = PointSetCache("/scratch/qmc_cache", max_bytes=2 ** 34)
+        x = cache.get(sobol_points, domain, n_samples)
+
+    or wrapped to be used wherever a point generator is expected:
+
+        points = cache.wrap(sobol_points)
+        x = points(domain, n_samples, seed=0)
+
+    Files are written to a temporary file and atomically renamed, hence
+    concurrent jobs can safely populate the cache. If the cache grows beyond
+    `max_bytes`, the least recently used point sets are removed.
+    """
+
+    def __init__(self, directory, max_bytes=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+        lmmr.io.ensure_directory_exists(dirname=directory)
+
+    def get(self, points, domain, n_samples, seed=0, **kwargs):
+        """Returns `points(domain, n_samples, seed=seed, **kwargs)`."""
+
+        filename = self.filename(points, domain, n_samples, seed, **kwargs)
+
+        try:
+            x = np.load(filename, mmap_mode="r")
+            os.utime(filename)
+            return x
+
+        except FileNotFoundError:
+            pass
+
+        x = points(domain, n_samples, seed=seed, **kwargs)
+        self._write(filename, x)
+        self.evict(keep=filename)
+
+        try:
+            return np.load(filename, mmap_mode="r")
+
+        except FileNotFoundError:
+            # Evicted by a concurrent process.
+            return x
+
+    def wrap(self, points):
+        """Cached version of the point generator `points`."""
+
+        def cached_points(domain, n_samples, seed=0, **kwargs):
+            return self.get(points, domain, n_samples, seed, **kwargs)
+
+        return cached_points
+
+    def filename(self, points, domain, n_samples, seed=0, **kwargs):
+        # The arguments fixed by a `functools.partial` are part of the key.
+        func = points.func if isinstance(points, functools.partial) else points
+
+        key = hashlib.sha256()
+        parameters = [
+            f"{func.__module__}.{func.__qualname__}",
+            np.asarray(_as_domain(domain), dtype=np.float64),
+            n_samples,
+            seed,
+            sorted(kwargs.items()),
+        ]
+        if func is not points:
+            parameters += [list(points.args), sorted(points.keywords.items())]
+
+        _update_cache_key(key, parameters)
+
+        return os.path.join(
+            self.directory, f"{func.__name__}-{key.hexdigest()[:32]}.npy"
+        )
+
+    def evict(self, keep=None):
+        """Remove the least recently used point sets until below `max_bytes`."""
+        if self.max_bytes is None:
+            return
+
+        entries = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if not name.endswith(".npy") or path == keep:
+                continue
+
+            try:
+                stat = os.stat(path)
+                entries.append((stat.st_mtime_ns, stat.st_size, path))
+            except FileNotFoundError:
+                pass
+
+        total_bytes = sum(size for _, size, _ in entries)
+        if keep is not None and os.path.exists(keep):
+            total_bytes += os.path.getsize(keep)
+
+        for _, size, path in sorted(entries):
+            if total_bytes <= self.max_bytes:
+                break
+
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+            total_bytes -= size
+
+    def _write(self, filename, x):
+        fd, tmp_filename = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            # Unlike `mkstemp`, respect the umask; the cache may be shared.
+            os.chmod(tmp_filename, 0o666 & ~_umask())
+
+            with os.fdopen(fd, "wb") as f:
+                np.save(f, x)
+
+            os.replace(tmp_filename, filename)
+
+        except BaseException:
+            os.remove(tmp_filename)
+            raise
+
+
+def _umask():
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+def _update_cache_key(key, obj):
+    if isinstance(obj, np.ndarray):
+        key.update(f"{obj.dtype.str}{obj.shape}".encode())
+        key.update(np.ascontiguousarray(obj).tobytes())
+
+    elif isinstance(obj, (list, tuple)):
+        key.update(f"{type(obj).__name__}{len(obj)}".encode())
+        for o in obj:
+            _update_cache_key(key, o)
+
+    else:
+        key.update(repr(obj).encode())
+
+
+class SobolVarianceEstimator:
+    """Incremental estimate of the Sobol indices of `indices`.
+
+    The estimator is the one of `sobol_variances`. It stores only the
+    number of samples, the means of `f(x1)`, `f(x12)`, `f(x21)` and the
+    co-moments of `f(x1)` with each of the three. This is enough to compute
+    `f0`, `D`, `Dy` and `Dz`, to extend the estimate with further Sobol points
+    and to merge estimates of disjoint parts of the Sobol sequence. Without any
+    samples, the statistics are NaN.
+
+    Typical usage:
+        sv = SobolVarianceEstimator(f, n_params, indices)
+        Sy, Stot_y = sv.run(rtol=1e-3)
+
+    or, if worker `rank` computes its own part:
+        sv = SobolVarianceEstimator(f, n_params, indices, seed=rank * n_local)
+        sv.extend(n_local)
+        # ... send `sv` to the root and
+        sv.merge(other)
+
+    The model `f` is evaluated on at most `chunk_size` points at once. These
+    evaluations are split further over `executor`, if one is given, see
+    `lmmr.parallel.map_chunks`.
+
+    Instead of Sobol points any other `points(domain, n_samples, seed)`, e.g.
+    `lattice_points` or `halton_points`, can be used.
+    """
+
+    def __init__(
+        self,
+        f,
+        n_params,
+        indices,
+        seed=0,
+        chunk_size=2 ** 14,
+        executor=None,
+        points=sobol_points,
+    ):
+        self.f = f
+        self.n_params = n_params
+        self.mask = np.array([i in indices for i in range(n_params)])
+        self.seed = seed
+        self.chunk_size = chunk_size
+        self.executor = executor
+        self.points = points
+
+        self.n_samples = 0
+        self.means = 0.0
+        self.comoments = 0.0
+        self.converged = False
+
+    @property
+    def f0(self):
+        return self._statistic(lambda: self.means[0])
+
+    @property
+    def D(self):
+        return self._statistic(lambda: self.comoments[0] / self.n_samples)
+
+    @property
+    def Dy(self):
+        return self._statistic(lambda: self.comoments[1] / self.n_samples)
+
+    @property
+    def Dz(self):
+        return self._statistic(lambda: self.comoments[2] / self.n_samples)
+
+    def sobol_indices(self):
+        """Returns `Sy, Stot_y` of the samples seen so far."""
+        return self.Dy / self.D, 1 - self.Dz / self.D
+
+    def extend(self, n_samples):
+        """Add the next `n_samples` points to the estimate."""
+
+        domain = unit_box(2 * self.n_params)
+
+        for k in range(0, n_samples, self.chunk_size):
+            n_chunk = min(self.chunk_size, n_samples - k)
+            X = self.points(domain, n_chunk, seed=self.seed + k)
+            self._add(*self._evaluate(X))
+
+        self.seed += n_samples
+
+    def merge(self, other):
+        """Add the statistics of `other` to `self`.
+
+        The two estimators must have used disjoint parts of the Sobol sequence.
+        Afterwards, `extend` continues after the later of the two parts.
+        """
+        self._add(other.n_samples, other.means, other.comoments)
+        self.seed = max(self.seed, other.seed)
+
+    def run(self, atol=0.0, rtol=1e-2, n_initial=1024, max_samples=2 ** 20):
+        """Double the number of samples until the Sobol indices have converged.
+
+        Since the points aren't independent, the error is estimated by the
+        change of `Sy` and `Stot_y` since the previous doubling. The estimate
+        has converged if the change is below `atol + rtol * |S|`. Whether it
+        converged before exceeding `max_samples` is stored in `converged`.
+
+        Returns `Sy, Stot_y` like `sobol_variances`.
+        """
+
+        if self.n_samples == 0:
+            self.extend(n_initial)
+
+        S = np.array(self.sobol_indices())
+        self.converged = False
+
+        while not self.converged and 2 * self.n_samples <= max_samples:
+            self.extend(self.n_samples)
+
+            S_previous, S = S, np.array(self.sobol_indices())
+            self.converged = np.all(np.abs(S - S_previous) <= atol + rtol * np.abs(S))
+
+        return S[0], S[1]
+
+    def _evaluate(self, X):
+        x1, x2 = X[:, : self.n_params], X[:, self.n_params :]
+
+        x12 = np.where(self.mask, x1, x2)
+        x21 = np.where(self.mask, x2, x1)
+
+        x = np.concatenate([x1, x12, x21])
+        fx = lmmr.parallel.map_chunks(self.f, x, self.executor)
+        fx = fx.reshape((3, -1) + fx.shape[1:])
+
+        means = np.mean(fx, axis=1)
+        dfx = fx - means[:, np.newaxis, ...]
+        comoments = np.sum(dfx[0] * dfx, axis=1)
+
+        return X.shape[0], means, comoments
+
+    def _statistic(self, compute):
+        # Before the first sample, the shape of `f(x)` isn't known.
+        return np.nan if self.n_samples == 0 else compute()
+
+    def _add(self, n_samples, means, comoments):
+        if n_samples == 0:
+            return
+
+        # The co-moments are those of `fx1` with `fx1`, `fx12` and `fx21`.
+        self.n_samples, self.means, self.comoments = merge_moments(
+            (self.n_samples, self.means, self.comoments),
+            (n_samples, means, comoments),
+            cross=0,
+        )
+
+
+def sobol_variances(
+    f, n_params, n_samples, indices, executor=None, points=sobol_points
+):
     # See Sobol (2001), https://doi.org/10.1016/S0378-4754(00)00270-6
 
-    domain = unit_box(2 * n_params)
-    X = sobol_points(domain, n_samples)
+    sv = SobolVarianceEstimator(
+        f,
+        n_params,
+        indices,
+        chunk_size=max(n_samples, 1),
+        executor=executor,
+        points=points,
+    )
+    sv.extend(n_samples)
+
+    return sv.sobol_indices()
+
+
+def _saltelli_design(n_params, n_samples, second_order, points):
+    """The matrices `A`, `B`, `AB_i` and, optionally, `BA_i` stacked on axis 0.
+
+    The matrix `AB_i` is `A` with column `i` taken from `B` and vice versa for
+    `BA_i`. The result has shape `(n_blocks * n_samples, n_params)` with
+    `n_blocks` equal to `n_params + 2` or `2 * n_params + 2`.
+    """
+    X = points(unit_box(2 * n_params), n_samples)
+    A, B = X[:, :n_params], X[:, n_params:]
+
+    n_blocks = 2 * n_params + 2 if second_order else n_params + 2
+    design = np.empty((n_blocks, n_samples, n_params))
+    design[0], design[1] = A, B
+
+    for i in range(n_params):
+        design[2 + i] = A
+        design[2 + i, :, i] = B[:, i]
+
+        if second_order:
+            design[2 + n_params + i] = B
+            design[2 + n_params + i, :, i] = A[:, i]
+
+    return design.reshape((-1, n_params))
+
+
+def sobol_indices(
+    f, n_params, n_samples, second_order=False, executor=None, points=sobol_points
+):
+    """Compute all first and total order Sobol indices in one pass.
+
+    The function `f` is evaluated once on all `n_samples * (n_params + 2)`
+    points, or `n_samples * (2 * n_params + 2)` points if `second_order`.
+    Like in `sobol_variances` `f` maps an array of shape `(n, n_params)` to
+    an array with the `n` results on axis 0. If an `executor` is given, the
+    evaluations are split over it, see `lmmr.parallel.map_chunks`. The design
+    is built from `points(domain, n_samples)`, by default Sobol points.
+
+    Returns `S, S_tot` and, if `second_order`, additionally `S2`. Here `S[i]`
+    and `S_tot[i]` are the first and total order indices of parameter `i`;
+    and `S2[i, j]` is the second order index of parameters `i` and `j`. The
+    diagonal of `S2` is NaN.
+
+    See Saltelli et al. (2010), https://doi.org/10.1016/j.cpc.2009.09.018
+    """
+
+    design = _saltelli_design(n_params, n_samples, second_order, points)
+    fx = lmmr.parallel.map_chunks(f, design, executor)
+    fx = fx.reshape((-1, n_samples) + fx.shape[1:])
 
-    x1, x2 = X[:, :n_params], X[:, n_params:]
+    fA, fB, fAB = fx[0], fx[1], fx[2 : n_params + 2]
 
-    mask = np.array([i in indices for i in range(n_params)])
-    x12 = np.where(mask, x1, x2)
-    x21 = np.where(mask, x2, x1)
+    f0 = np.mean(fx[:2], axis=(0, 1))
+    dfA, dfB, dfAB = fA - f0, fB - f0, fAB - f0
 
-    fx1, fx12, fx21 = f(x1), f(x12), f(x21)
+    D = np.mean(fx[:2] ** 2, axis=(0, 1)) - f0 ** 2
+    S = np.mean(dfB * (dfAB - dfA), axis=1) / D
+    S_tot = 0.5 * np.mean((dfA - dfAB) ** 2, axis=1) / D
 
-    f0 = np.mean(fx1, axis=0)
-    dfx1 = fx1 - f0
-    dfx12 = fx12 - f0
-    dfx21 = fx21 - f0
+    if not second_order:
+        return S, S_tot
 
-    D = np.mean(dfx1 ** 2, axis=0)
-    Dy = np.mean(dfx1 * dfx12, axis=0)
-    Dz = np.mean(dfx1 * dfx21, axis=0)
+    dfBA = fx[n_params + 2 :] - f0
+    Vc = np.einsum("in...,jn...->ij...", dfBA, dfAB) / n_samples
+    Vc -= np.mean(dfA * dfB, axis=0)
 
-    Sy = Dy / D
-    Stot_y = 1 - Dz / D
+    S2 = Vc / D - S[:, np.newaxis, ...] - S[np.newaxis, :, ...]
+    S2[np.diag_indices(n_params)] = np.nan
 
-    return Sy, Stot_y
+    return S, S_tot, S2
@@ -1,15 +1,124 @@
 
 # This file is a shallow wrapper around `np.random`. Enabling use of the
 # new RNG with a familiar API.
+#
+# The main thread uses the global RNG. Every other thread gets its own RNG,
+# spawned from the same `SeedSequence`. Independent streams can be bound to the
+# current thread explicitly, e.g. one per task, using `stream`:
+#
+#     lmmr.random.seed(42)
+#     seeds = lmmr.random.spawn(n_tasks)
+#
+#     def task(k):
+#         with lmmr.random.stream(seeds[k]):
+#             return lmmr.random.uniform(size=n)
+#
+# which is reproducible regardless of which thread or process runs the task.
+#
+# Only such explicit streams are reproducible bit-for-bit. The RNGs of other
+# threads are spawned in the order in which the threads first use them, i.e.
+# they depend on scheduling. Forked child processes derive their global RNG
+# from the parent's `SeedSequence` and the number of preceding forks.
+
+import os
+import threading
+import contextlib
 
 import numpy as np
 
+_local = threading.local()
+_lock = threading.Lock()
+
+
+def seed(entropy=None):
+    """(Re)set the global RNG.
+
+    All streams are derived from `np.random.SeedSequence(entropy)`. The RNGs of
+    other threads are reset too, the next time they're used.
+    """
+    with _lock:
+        _set_seed_sequence(np.random.SeedSequence(entropy))
+
+
+def _set_seed_sequence(seed_sequence):
+    global_rng._seed_sequence = seed_sequence
+    global_rng._rng = np.random.default_rng(seed_sequence)
+    global_rng._generation = getattr(global_rng, "_generation", 0) + 1
+    global_rng._n_forks = 0
+
+
+def spawn(n):
+    """Spawn `n` independent `SeedSequence`s from the global one."""
+    if not hasattr(global_rng, "_seed_sequence"):
+        seed()
+
+    with _lock:
+        return global_rng._seed_sequence.spawn(n)
+
+
+@contextlib.contextmanager
+def stream(seed_sequence):
+    """Use `default_rng(seed_sequence)` in the current thread.
+
+    Inside the context `global_rng` and all wrappers, e.g. `uniform`, use this
+    RNG. The argument can be anything accepted by `np.random.default_rng`.
+    """
+    streams = _local.__dict__.setdefault("streams", [])
+    streams.append(np.random.default_rng(seed_sequence))
+
+    try:
+        yield streams[-1]
+
+    finally:
+        streams.pop()
+
+
 def global_rng():
-    # TODO enable (re)setting the RNG.
+    """The RNG of the calling thread."""
+    streams = getattr(_local, "streams", None)
+    if streams:
+        return streams[-1]
+
     if not hasattr(global_rng, "_rng"):
-        global_rng._rng = np.random.default_rng()
+        seed()
+
+    if threading.current_thread() is threading.main_thread():
+        return global_rng._rng
+
+    if getattr(_local, "generation", None) != global_rng._generation:
+        _local.rng = np.random.default_rng(spawn(1)[0])
+        _local.generation = global_rng._generation
+
+    return _local.rng
+
+
+# Distinguishes the `SeedSequence` of forked processes from those of `spawn`.
+_FORK_SPAWN_KEY = 0x666F726B
+
+
+def _count_fork():
+    if hasattr(global_rng, "_seed_sequence"):
+        global_rng._n_forks += 1
+
+
+def _reseed_after_fork():
+    # Otherwise, every child process would draw the same numbers as the parent.
+    global _lock
+    _lock = threading.Lock()
+
+    if hasattr(global_rng, "_seed_sequence"):
+        parent = global_rng._seed_sequence
+        spawn_key = parent.spawn_key + (_FORK_SPAWN_KEY, global_rng._n_forks)
+        _set_seed_sequence(
+            np.random.SeedSequence(
+                parent.entropy, spawn_key=spawn_key, pool_size=parent.pool_size
+            )
+        )
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_parent=_count_fork, after_in_child=_reseed_after_fork)
 
-    return global_rng._rng
 
 def uniform(*args, **kwargs):
     rng = global_rng()
@@ -29,4 +138,3 @@ def multivariate_normal(*args, **kwargs):
 def choice(*args, **kwargs):
     rng = global_rng()
     return rng.choice(*args, **kwargs)
-
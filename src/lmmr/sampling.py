@@ -1,68 +1,442 @@
 # SPDX-License-Identifier: MIT
 # Copyright (c) 2021 ETH Zurich, Luc Grosheintz-Laval
 
+import collections
+import hashlib
+import threading
+import weakref
+
 import numpy as np
 import lmmr.random
+import lmmr.parallel
 
 
-def rejection_sampling(n_samples, rng, reject_if):
-    """Redraw samples that satisfy `reject_if`.
+class RejectionSampler:
+    """Draw samples which don't satisfy `reject_if`.
 
-    The `rng` is expected to either return one array with different samples on
-    axis 0, or a tuple of array, which each the samples on their axis 0.
+    The `rng` is expected to return either one array with different samples on
+    axis 0, or a tuple or dict of arrays, which each have the samples on their
+    axis 0.
 
     The exclusion criterium is expected to be of the form
         mask = reject_if(samples)
 
     where `mask` is a boolean mask.
+
+    The acceptance rate is estimated from all samples drawn so far and used to
+    choose the size of the next batch. Accepted samples which aren't needed
+    are kept for the next call. If more than `max_draws` samples are drawn in
+    one call, a `RuntimeError` is raised.
+
+    If an `executor` is given, both `rng` and `reject_if` are evaluated
+    concurrently on chunks of the samples, see `lmmr.parallel`.
     """
 
-    def keep(samples, valid):
-        if isinstance(samples, tuple):
-            return tuple(s[valid] for s in samples)
-        else:
-            return samples[valid]
+    def __init__(self, rng, reject_if, executor=None, max_draws=None):
+        self.rng = rng
+        self.reject_if = reject_if
+        self.executor = executor
+        self.max_draws = max_draws
 
-    def redraw(n_needed, n_redraw):
-        extra_samples = rng(n_redraw)
-        valid = np.logical_not(reject_if(extra_samples))
+        self.n_drawn = 0
+        self.n_accepted = 0
+        self.surplus = None
 
-        if np.count_nonzero(valid) < n_needed:
-            return redraw(n_needed, 2 * n_redraw)
+    @property
+    def acceptance_rate(self):
+        return self.n_accepted / self.n_drawn if self.n_drawn > 0 else None
 
-        else:
-            return keep(extra_samples, valid)
+    def __call__(self, n_samples):
+        samples = None
+        n_filled, n_drawn, n_draw = 0, 0, n_samples
+
+        while n_filled < n_samples:
+            if self.surplus is None:
+                n_draw = self._batch_size(n_samples - n_filled, n_draw)
+
+                if self.max_draws is not None:
+                    if n_drawn >= self.max_draws:
+                        raise RuntimeError(
+                            f"Rejection sampling reached {self.max_draws} draws, "
+                            f"with {n_filled} of {n_samples} samples accepted. The "
+                            f"estimated acceptance rate is {self.acceptance_rate}."
+                        )
+
+                    n_draw = min(n_draw, self.max_draws - n_drawn)
+
+                accepted = self._draw_accepted(n_draw)
+                n_drawn += n_draw
+
+            else:
+                accepted, self.surplus = self.surplus, None
+
+            if samples is None:
+                samples = lmmr.parallel._apply(
+                    lambda a: np.empty((n_samples,) + a.shape[1:], a.dtype), accepted
+                )
+
+            n_accepted = lmmr.parallel._leaves(accepted)[0].shape[0]
+            n_used = min(n_accepted, n_samples - n_filled)
+
+            lmmr.parallel._apply(
+                lambda s, a: np.copyto(s[n_filled : n_filled + n_used], a[:n_used]),
+                samples,
+                accepted,
+            )
+            n_filled += n_used
+
+            if n_used < n_accepted:
+                self.surplus = lmmr.parallel._apply(lambda a: a[n_used:], accepted)
 
-    samples = rng(n_samples)
-    invalid = reject_if(samples)
+        return samples if samples is not None else self._draw_accepted(0)
 
-    n_invalid = np.count_nonzero(invalid)
-    extra_samples = redraw(n_invalid, 2 * n_invalid)
+    def _batch_size(self, n_needed, n_previous):
+        rate = self.acceptance_rate
 
-    if isinstance(extra_samples, tuple):
-        for s, e in zip(samples, extra_samples):
-            s[invalid] = e[:n_invalid]
+        if rate is None:
+            return n_needed
 
-    else:
-        samples[invalid] = extra_samples[:n_invalid]
+        if rate == 0.0:
+            return 2 * n_previous
 
-    return samples
+        # Slightly more than expected, to avoid many small batches.
+        return int(np.ceil(1.1 * n_needed / rate)) + 16
+
+    def _draw_accepted(self, n_draw):
+        samples = lmmr.parallel.draw_chunks(self.rng, n_draw, self.executor)
+        mask = lmmr.parallel.map_chunks(self.reject_if, samples, self.executor)
+        valid = np.logical_not(mask)
+
+        self.n_drawn += n_draw
+        self.n_accepted += np.count_nonzero(valid)
+
+        return lmmr.parallel._apply(lambda a: a[valid], samples)
+
+
+def rejection_sampling(n_samples, rng, reject_if, executor=None, max_draws=None):
+    """Draw `n_samples` samples which don't satisfy `reject_if`.
+
+    See `RejectionSampler`, which should be used to keep surplus samples
+    across calls.
+    """
+    sampler = RejectionSampler(rng, reject_if, executor=executor, max_draws=max_draws)
+    return sampler(n_samples)
 
 
 def univariate_normal(mean, sigma, size):
     return lmmr.random.normal(mean, sigma, size=size)
 
 
-def multivariate_normal(mean, cov, size):
-    return lmmr.random.multivariate_normal(mean, cov, size=size)
+class MultivariateNormal:
+    """Sampler of normal distributions with covariance `cov`.
+
+    The covariance is factored once as `cov = L @ L.T`, using a Cholesky
+    decomposition or, if `cov` is only positive semi-definite, an eigen
+    decomposition. Afterwards, each draw is a single matrix product.
+    """
+
+    def __init__(self, cov):
+        cov = np.asarray(cov)
+
+        try:
+            self.L = np.linalg.cholesky(cov)
+
+        except np.linalg.LinAlgError:
+            w, V = np.linalg.eigh(cov)
+
+            if np.min(w) < -1e-8 * np.max(np.abs(w)):
+                raise ValueError("Covariance isn't positive semi-definite.")
+
+            self.L = V * np.sqrt(np.maximum(w, 0.0))
+
+    def __call__(self, mean, size=None):
+        """Draw samples with mean `mean`.
+
+        The `mean` may have shape `(..., n_dims)`, i.e. a batch of means. The
+        samples have shape `size + (n_dims,)`, or the shape of `mean` if
+        `size` is `None`. The leading axes of `mean` are broadcast with `size`.
+        """
+        mean = np.asarray(mean)
+
+        if size is None:
+            size = mean.shape[:-1]
+        elif np.isscalar(size):
+            size = (size,)
+
+        z = lmmr.random.normal(size=tuple(size) + (self.L.shape[0],))
+        return mean + z @ self.L.T
+
+
+_cache = collections.OrderedDict()
+_by_id = collections.OrderedDict()
+_lock = threading.Lock()
+
+
+def cached_multivariate_normal(cov, max_size=8, assume_unchanged=False):
+    """The `MultivariateNormal` of `cov`, cached by the content of `cov`.
+
+    At most `max_size` factorizations are kept; the least recently used one is
+    evicted first.
+
+    Hashing `cov` costs `O(n_dims**2)`. Therefore, if an array object is passed
+    again, only a fingerprint of `O(n_dims)` entries, e.g. the diagonal, is
+    compared. Hence, in-place changes of `cov` are detected, unless they
+    happen to leave the fingerprint unchanged. If `assume_unchanged` is set,
+    the caller guarantees that `cov` wasn't modified in-place and even the
+    fingerprint is skipped. Alternatively, keep the `MultivariateNormal` around
+    and draw from it directly.
+    """
+    is_array = isinstance(cov, np.ndarray) and cov.ndim == 2
+
+    if is_array:
+        with _lock:
+            entry = _by_id.get(id(cov))
+
+        if entry is not None and entry[0]() is cov:
+            if assume_unchanged or np.array_equal(entry[1], _fingerprint(cov)):
+                return entry[2]
+
+    array = np.ascontiguousarray(cov)
+    key = (array.shape, array.dtype.str, hashlib.sha1(array).hexdigest())
+
+    with _lock:
+        sampler = _cache.get(key)
+        if sampler is not None:
+            _cache.move_to_end(key)
+
+    if sampler is None:
+        sampler = MultivariateNormal(array)
+
+    with _lock:
+        sampler = _cache.setdefault(key, sampler)
+        _cache.move_to_end(key)
+
+        if is_array:
+            _by_id[id(cov)] = (weakref.ref(cov), _fingerprint(cov), sampler)
+            _by_id.move_to_end(id(cov))
+
+        for cache in [_cache, _by_id]:
+            while len(cache) > max_size:
+                cache.popitem(last=False)
+
+    return sampler
+
+
+def _fingerprint(cov):
+    """The diagonal and a sparse subgrid of `cov`, about `2 * n_dims` entries."""
+    step = max(1, int(np.sqrt(cov.shape[0])))
+    return np.concatenate([np.diagonal(cov), cov[::step, ::step].reshape(-1)])
+
+
+def multivariate_normal(mean, cov, size, assume_unchanged=False):
+    """Draw normal samples, see `MultivariateNormal`.
+
+    The factorization of `cov` is cached, see `cached_multivariate_normal`.
+    """
+    sampler = cached_multivariate_normal(cov, assume_unchanged=assume_unchanged)
+    return sampler(mean, size=size)
+
 
+def joint_choice(arrays, n, axis=0, chunk_size=None):
+    """Subsample the `arrays` jointly, i.e. using the same indices.
 
-def joint_choice(arrays, n, axis=0):
+    The arrays can be NumPy arrays, `np.memmap`s or anything with a `shape`,
+    `dtype` and NumPy-style indexing, e.g. h5py datasets. Arrays which aren't
+    in memory are read in increasing order of the indices, `chunk_size`
+    indices at a time; and dense runs of indices are read as one slab.
+
+    Returns the subsampled arrays and the indices `I`, such that the `k`-th
+    subsample is element `I[k]` of the arrays along `axis`.
+    """
     N = arrays[0].shape[axis]
     I = lmmr.random.choice(N, size=(n,), replace=False)
 
-    subsampled_arrays = tuple(
-        np.swapaxes(np.swapaxes(a, 0, axis)[I, ...], 0, axis) for a in arrays
-    )
+    order = np.argsort(I)
+    I_sorted = I[order]
+    chunk_size = max(n, 1) if chunk_size is None else chunk_size
+
+    def subsample(a):
+        axis_a = axis % len(a.shape)
+        shape = a.shape[:axis_a] + (n,) + a.shape[axis_a + 1 :]
+        out = np.empty(shape, dtype=a.dtype)
+
+        if type(a) is np.ndarray:
+            return np.take(a, I, axis=axis_a, out=out)
+
+        for lo in range(0, n, chunk_size):
+            hi = min(lo + chunk_size, n)
+            chunk = _take_sorted(a, I_sorted[lo:hi], axis_a)
+            chunk = np.moveaxis(chunk, axis_a, 0)
+            np.moveaxis(out, axis_a, 0)[order[lo:hi]] = chunk
+
+        return out
+
+    return tuple(subsample(a) for a in arrays), I
+
+
+def _take_sorted(a, I, axis, max_gap=4):
+    """Equivalent of `np.take(a, I, axis=axis)` for sorted indices `I`.
+
+    If the indices are dense enough, i.e. reading everything from `I[0]` to
+    `I[-1]` reads no more than `max_gap` times the requested amount, one
+    contiguous slab is read.
+    """
+    lo, hi = int(I[0]), int(I[-1]) + 1
+    slices = [slice(None)] * len(a.shape)
+
+    if hi - lo <= max_gap * I.size:
+        slices[axis] = slice(lo, hi)
+        return np.take(np.asarray(a[tuple(slices)]), I - lo, axis=axis)
+
+    slices[axis] = I
+    return np.asarray(a[tuple(slices)])
+
+
+class ReservoirSampler:
+    """Uniform or weighted subsample of size `n` of a stream of samples.
+
+    The samples arrive in chunks, each a tuple of aligned arrays with the
+    samples on axis 0. Only the `n` selected samples are kept in memory.
+    Typical usage:
+
+        sampler = ReservoirSampler(n)
+        for chunk in chunks:
+            sampler.add(chunk)
+
+        subsampled_arrays, I = sampler.samples()
+
+    where `I` are the global indices of the selected samples. If `weights` is
+    given, `weights(chunk)` must return the (non-negative) weight of each
+    sample in `chunk`; and the samples are selected with probability
+    proportional to their weight.
+
+    Uniform samples use Algorithm L, which only needs random numbers for the
+    samples which enter the reservoir. Weighted samples use the keys `u**(1/w)`
+    of A-Res, which A-ExpJ samples more efficiently, one chunk at a time.
+
+    See Li (1994), https://doi.org/10.1145/198429.198435 and Efraimidis,
+    Spirakis (2006), https://doi.org/10.1016/j.ipl.2005.11.003
+    """
+
+    def __init__(self, n, weights=None):
+        self.n = n
+        self.weights = weights
+
+        self.n_seen = 0
+        self.n_filled = 0
+        self.reservoir = None
+        self.indices = np.empty(n, dtype=np.int64)
+        self.log_keys = np.empty(n)
+
+        self.log_W = None
+        self.next_index = None
+
+    def add(self, chunk):
+        """Add the next chunk of samples to the stream."""
+        if self.reservoir is None:
+            self.reservoir = tuple(
+                np.empty((self.n,) + a.shape[1:], dtype=a.dtype) for a in chunk
+            )
+
+        if self.weights is None:
+            self._add_uniform(chunk)
+        else:
+            self._add_weighted(chunk)
+
+        self.n_seen += chunk[0].shape[0]
+
+    def samples(self):
+        """The subsampled arrays and their global indices."""
+        k = self.n_filled
+        return tuple(r[:k] for r in self.reservoir), self.indices[:k]
+
+    def _add_uniform(self, chunk):
+        rng = lmmr.random.global_rng()
+        start, end = self.n_seen, self.n_seen + chunk[0].shape[0]
+
+        k = min(self.n - self.n_filled, end - start)
+        if k > 0:
+            self._assign(np.arange(self.n_filled, self.n_filled + k), chunk, 0, k)
+            self.n_filled += k
+
+            if self.n_filled == self.n:
+                self.log_W = np.log(rng.uniform()) / self.n
+                self.next_index = self.n - 1 + self._gaps(rng, self.log_W)
+
+        while self.next_index is not None and self.next_index < end:
+            # Expected number of replacements, plus a margin.
+            n_batch = int(1.2 * self.n * np.log(end / self.next_index)) + 16
+
+            log_W = self.log_W + np.cumsum(np.log(rng.uniform(size=n_batch))) / self.n
+            log_W = np.concatenate([[self.log_W], log_W])
+
+            positions = np.concatenate([[0.0], np.cumsum(self._gaps(rng, log_W[1:]))])
+            positions += self.next_index
+
+            n_replaced = np.searchsorted(positions[:-1], end)
+            slots = rng.integers(0, self.n, size=n_replaced)
+            positions_replaced = positions[:n_replaced].astype(np.int64)
+
+            # If a slot is replaced more than once, the last replacement wins.
+            _, last = np.unique(slots[::-1], return_index=True)
+            last = n_replaced - 1 - last
+
+            self._assign(slots[last], chunk, positions_replaced[last] - start)
+            self.log_W = log_W[n_replaced]
+            self.next_index = positions[n_replaced]
+
+    @staticmethod
+    def _gaps(rng, log_W):
+        # Number of samples to skip, plus one; capped to avoid overflow.
+        v = rng.uniform(size=np.shape(log_W))
+        gaps = np.floor(np.log(v) / np.log1p(-np.exp(log_W))) + 1.0
+        return np.minimum(gaps, 2.0 ** 62)
+
+    def _add_weighted(self, chunk):
+        rng = lmmr.random.global_rng()
+
+        with np.errstate(divide="ignore"):
+            log_keys = np.log(rng.uniform(size=chunk[0].shape[0])) / self.weights(chunk)
+
+        candidates = np.arange(chunk[0].shape[0])
+        if self.n_filled == self.n:
+            # Only samples with a larger key than the smallest in the
+            # reservoir can enter it.
+            candidates = candidates[log_keys > np.min(self.log_keys)]
+
+        all_keys = np.concatenate(
+            [self.log_keys[: self.n_filled], log_keys[candidates]]
+        )
+        n_keep = min(self.n, all_keys.size)
+        n_drop = all_keys.size - n_keep
+        keep = np.argpartition(all_keys, n_drop)[n_drop:]
+
+        from_reservoir = keep[keep < self.n_filled]
+        from_chunk = candidates[keep[keep >= self.n_filled] - self.n_filled]
+
+        slots = np.setdiff1d(np.arange(n_keep), from_reservoir, assume_unique=True)
+
+        self._assign(slots, chunk, from_chunk)
+        self.log_keys[slots] = log_keys[from_chunk]
+        self.n_filled = n_keep
+
+    def _assign(self, slots, chunk, lo, hi=None):
+        I = slice(lo, hi) if hi is not None else lo
+
+        for r, a in zip(self.reservoir, chunk):
+            r[slots] = a[I]
+
+        self.indices[slots] = self.n_seen + np.arange(chunk[0].shape[0])[I]
+
+
+def reservoir_sampling(chunks, n, weights=None):
+    """Subsample `n` samples from an iterable of chunks of aligned arrays.
+
+    Returns the subsampled arrays and their global indices, see
+    `ReservoirSampler`.
+    """
+    sampler = ReservoirSampler(n, weights=weights)
+    for chunk in chunks:
+        sampler.add(chunk)
 
-    return subsampled_arrays, I
+    return sampler.samples()
@@ -1,6 +1,9 @@
 # SPDX-License-Identifier: MIT
 # Copyright (c) 2021 ETH Zurich, Luc Grosheintz-Laval
 
+import numpy as np
+
+
 def merge_dict(d1, d2):
     """Merge two dictionaries, i.e. {**d1, **d2} in Python 3.5 onwards."""
     d12 = d1.copy()
@@ -32,3 +35,29 @@ def hhmmss(t):
     hours, seconds = divmod(t.seconds, 3600)
     minutes, seconds = divmod(seconds, 60)
     return "{:02d}:{:02d}:{:02d}".format(24 * days + hours, minutes, seconds)
+
+
+def merge_moments(a, b, cross=None):
+    """Merge the statistics `(n, mean, M2)` of two sets of samples.
+
+    Here `M2` is the sum of the squared deviations from the mean. If `cross` is
+    an index, `M2[k]` is the sum of `(x[cross] - mean[cross]) * (x[k] - mean[k])`
+    instead, i.e. the co-moments with the component `cross` along axis 0.
+
+    The counts `n` can be arrays, e.g. one count per bin, and may be zero.
+
+    See Chan, Golub, LeVeque (1979).
+    """
+    n_a, mean_a, M2_a = a
+    n_b, mean_b, M2_b = b
+
+    n = n_a + n_b
+    w_b = np.divide(n_b, n, out=np.zeros(np.shape(n)), where=n > 0)
+
+    delta = mean_b - mean_a
+    delta_x = delta if cross is None else delta[cross]
+
+    mean = mean_a + delta * w_b
+    M2 = M2_a + M2_b + delta_x * delta * (n_a * w_b)
+
+    return n, mean, M2
@@ -4,10 +4,12 @@
 import lmmr
 
 import tempfile
+import concurrent.futures
 import os
 import h5py
 import netCDF4
 import numpy as np
+import pytest
 
 
 def run_on_random_file(create_file, run_checks, suffix):
@@ -55,4 +57,243 @@ def test_read_array_nc():
         foo = lmmr.io.read_array(filename, "foo")
         assert np.all(foo == ground_truth)
 
+        I = np.arange(0, 40, 2)
+        subslices = (slice(10), 3, I)
+        subfoo = lmmr.io.read_array(filename, "foo", slices=subslices)
+        assert np.all(subfoo == ground_truth[:10, 3, ::2])
+
+        assert lmmr.io.read_array_shape(filename, "foo") == ground_truth.shape
+
+    run_on_random_file(create_file_nc, check_reading, suffix=".nc")
+
+
+def test_file_handle_pool():
+    def check_reading(filename, ground_truth):
+        lmmr.io.enable_file_handle_pool(max_size=1)
+        pool = lmmr.io.basics.enable_file_handle_pool.pool
+
+        try:
+            with concurrent.futures.ThreadPoolExecutor(4) as executor:
+                slices = [np.s_[k : k + 10, ...] for k in range(0, 160, 10)]
+                futures = [
+                    executor.submit(lmmr.io.read_array, filename, "foo", s)
+                    for s in slices
+                ]
+                for s, future in zip(slices, futures):
+                    assert np.all(future.result() == ground_truth[s])
+
+            assert len(pool._handles) == 1
+            (h5,) = [h.file for h in pool._handles.values()]
+            assert lmmr.io.read_array_shape(filename, "foo") == ground_truth.shape
+            assert [h.file for h in pool._handles.values()] == [h5]
+
+            other = filename + ".h5"
+            create_file_h5(other, ground_truth[:2])
+            assert np.all(lmmr.io.read_array(other, "foo") == ground_truth[:2])
+            assert len(pool._handles) == 1
+            assert not h5
+
+            # Files must be closed before writing; modified files are reopened.
+            pool.close(other)
+            create_file_h5(other, ground_truth[:3])
+            assert lmmr.io.read_array_shape(other, "foo") == (3, 800, 40)
+
+            (h5,) = [h.file for h in pool._handles.values()]
+            mtime = os.stat(other).st_mtime_ns + 10 ** 9
+            os.utime(other, ns=(mtime, mtime))
+            assert lmmr.io.read_array_shape(other, "foo") == (3, 800, 40)
+            assert [h.file for h in pool._handles.values()] != [h5]
+            assert not h5
+
+        finally:
+            lmmr.io.disable_file_handle_pool()
+
+        assert not pool._handles
+
+    run_on_random_file(create_file_h5, check_reading, suffix=".h5")
+
+
+def create_file_h5_chunked(filename, array):
+    with h5py.File(filename, "w") as h5:
+        h5.create_dataset("foo", data=array, chunks=(7, 100, 8))
+
+
+def test_iter_array_chunks():
+    def check_iteration(filename, ground_truth):
+        for axis, prefetch in [(0, None), (1, False), (2, None)]:
+            blocks = []
+            offset = 0
+
+            chunks = lmmr.io.iter_array_chunks(
+                filename, "foo", axis=axis, target_bytes=2 ** 20, prefetch=prefetch
+            )
+            for (lo, hi), block in chunks:
+                assert lo == offset
+                assert block.shape[axis] == hi - lo
+                assert block.nbytes <= 2 ** 20 or hi - lo <= 100
+
+                offset = hi
+                blocks.append(np.copy(block))
+
+            assert offset == ground_truth.shape[axis]
+            assert np.all(np.concatenate(blocks, axis=axis) == ground_truth)
+
+    run_on_random_file(create_file_h5_chunked, check_iteration, suffix=".h5")
+    run_on_random_file(create_file_nc, check_iteration, suffix=".nc")
+
+
+def test_iter_array_chunks_nc_prefetch():
+    def check_prefetch(filename, ground_truth):
+        with pytest.raises(ValueError):
+            next(lmmr.io.iter_array_chunks(filename, "foo", prefetch=True))
+
+    run_on_random_file(create_file_nc, check_prefetch, suffix=".nc")
+
+
+def test_iter_array_chunks_alignment():
+    def check_alignment(filename, ground_truth):
+        chunks = lmmr.io.iter_array_chunks(filename, "foo", target_bytes=2 ** 20)
+        bounds = [b for b, _ in chunks]
+
+        # A slab of one chunk is 7 * 800 * 40 * 8 bytes, i.e. 1.71 MB.
+        assert bounds[:2] == [(0, 7), (7, 14)]
+        assert bounds[-1] == (154, 160)
+
+    run_on_random_file(create_file_h5_chunked, check_alignment, suffix=".h5")
+
+
+def test_read_array_mmap():
+    def check_reading(filename, ground_truth):
+        subslices = (slice(10), 3, slice(None, None, 2))
+        foo = lmmr.io.read_array(filename, "foo", slices=subslices, mmap=True)
+        assert np.all(foo == ground_truth[subslices])
+
+        with h5py.File(filename, "r") as h5:
+            is_contiguous = h5["foo"].chunks is None
+
+        foo = lmmr.io.read_array(filename, "foo", mmap=True)
+        assert isinstance(foo, np.memmap) == is_contiguous
+        assert np.all(foo == ground_truth)
+
+        if is_contiguous:
+            assert not foo.flags.writeable
+
+        I = np.arange(0, 40, 2)
+        subfoo = lmmr.io.read_array(filename, "foo", slices=(0, I), mmap=True)
+        assert not isinstance(subfoo, np.memmap)
+        assert np.all(subfoo == ground_truth[0, I])
+
+    run_on_random_file(create_file_h5, check_reading, suffix=".h5")
+    run_on_random_file(create_file_h5_chunked, check_reading, suffix=".h5")
+
+
+def test_read_arrays():
+    arrays = [np.random.uniform(size=(4, 5, 6)) for _ in range(4)]
+
+    with tempfile.TemporaryDirectory() as wd:
+        filenames = [os.path.join(wd, f"__a{k}.h5") for k in range(3)]
+        filenames.append(os.path.join(wd, "__a3.nc"))
+
+        for filename, array in zip(filenames[:3], arrays[:3]):
+            create_file_h5(filename, array)
+        create_file_nc(filenames[3], arrays[3])
+
+        requests, expected = [], []
+        for k in [3, 0, 1, 3, 2, 0]:
+            requests.append((filenames[k], "foo", np.s_[k, :, 1:4]))
+            expected.append(arrays[k][k, :, 1:4])
+
+        results = lmmr.io.read_arrays(requests, max_workers=2)
+        for result, e in zip(results, expected):
+            assert np.all(result == e)
+
+        stacked = lmmr.io.read_arrays(requests, max_workers=2, stack=True)
+        assert stacked.shape == (len(requests), 5, 3)
+        assert np.all(stacked == np.array(expected))
+
+        results = lmmr.io.read_arrays([(filenames[0], "foo")])
+        assert np.all(results[0] == arrays[0])
+
+        results = lmmr.io.read_arrays(r for r in requests[:2])
+        assert len(results) == 2 and np.all(results[1] == expected[1])
+
+    assert lmmr.io.read_arrays([]) == []
+    assert lmmr.io.read_arrays([], stack=True).shape == (0,)
+
+
+def test_array_appender():
+    batches = [np.random.uniform(size=(n, 3, 4)) for n in [10, 1, 0, 25]]
+    expected = np.concatenate(batches)
+
+    with tempfile.TemporaryDirectory() as wd:
+        for suffix in [".h5", ".nc"]:
+            filename = os.path.join(wd, "out", "__a" + suffix)
+
+            lmmr.io.write_array(filename, "foo", batches[0])
+            with lmmr.io.ArrayAppender(filename, "foo", shape=(3, 4)) as appender:
+                assert appender.n_samples == 10
+                for batch in batches[1:]:
+                    appender.append(batch)
+
+            assert lmmr.io.read_array_shape(filename, "foo") == expected.shape
+            assert np.all(lmmr.io.read_array(filename, "foo") == expected)
+
+            with pytest.raises(ValueError):
+                lmmr.io.ArrayAppender(filename, "foo", shape=(4,))
+
+            with pytest.raises(ValueError):
+                lmmr.io.write_array(filename, "foo", batches[0])
+            assert lmmr.io.read_array_shape(filename, "foo") == expected.shape
+
+        with h5py.File(filename.replace(".nc", ".h5"), "r") as h5:
+            assert h5["foo"].maxshape == (None, 3, 4)
+            assert h5["foo"].compression == "gzip"
+            assert h5["foo"].chunks == (2 ** 20 // (12 * 8), 3, 4)
+
+
+def test_auto_chunks():
+    auto_chunks = lmmr.io.basics._auto_chunks
+
+    assert auto_chunks((), 8, 2 ** 20) == (2 ** 17,)
+    assert auto_chunks((10,), 4, 100) == (2, 10)
+    assert auto_chunks((1000, 1000), 8, 2 ** 20) == (1, 250, 500)
+
+
+def test_iter_array_chunks_file_handle_pool():
+    def check_concurrent_reads(filename, ground_truth):
+        lmmr.io.enable_file_handle_pool()
+
+        try:
+            chunks = lmmr.io.iter_array_chunks(filename, "foo", target_bytes=2 ** 20)
+            with concurrent.futures.ThreadPoolExecutor(1) as executor:
+                for (lo, hi), block in chunks:
+                    future = executor.submit(lmmr.io.read_array, filename, "foo")
+                    assert np.all(future.result(timeout=10) == ground_truth)
+
+        finally:
+            lmmr.io.disable_file_handle_pool()
+
+    run_on_random_file(create_file_h5_chunked, check_concurrent_reads, suffix=".h5")
+
+
+def test_file_handle_pool_nc():
+    def check_reading(filename, ground_truth):
+        other = filename + ".nc"
+        create_file_nc(other, ground_truth[:2])
+
+        pool = lmmr.io.FileHandlePool()
+        try:
+            with pool.open(filename, "NETCDF") as nc:
+                with pool.open(other, "NETCDF") as other_nc:
+                    assert other_nc["foo"].shape == (2, 800, 40)
+
+                assert nc["foo"].shape == ground_truth.shape
+
+            # Different NetCDF files share one lock.
+            first, second = pool._handles.values()
+            assert first.lock is second.lock
+
+        finally:
+            pool.close()
+
     run_on_random_file(create_file_nc, check_reading, suffix=".nc")
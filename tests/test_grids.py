@@ -0,0 +1,63 @@
+import lmmr
+import numpy as np
+import pytest
+
+from lmmr.grids import Grid
+
+
+def test_uniform_grid():
+    grid = Grid.uniform([0.0, -1.0, 0.0], [1.0, 1.0, 2.0], (4, 8, 16))
+
+    assert grid.is_uniform
+    assert grid.shape == (4, 8, 16)
+    assert np.allclose(grid.centers[0], [0.125, 0.375, 0.625, 0.875])
+    assert grid.centers is grid.centers
+
+    x, y, z = grid.mesh()
+    assert x.shape == (4, 1, 1) and y.shape == (1, 8, 1) and z.shape == (1, 1, 16)
+
+    assert grid.volumes.shape == grid.shape
+    assert np.isclose(np.sum(grid.volumes), 4.0)
+    assert grid.volumes.strides == (0, 0, 0)
+
+    x = np.linspace(0.0, 1.0, 10)
+    grid = Grid.from_centers(x)
+    assert np.allclose(grid.boundaries[0], lmmr.grids.uniform_boundaries(x))
+    assert np.allclose(grid.centers[0], x)
+
+
+def test_non_uniform_grid():
+    x_bd = np.array([0.0, 0.1, 0.3, 0.6, 1.0])
+    y_bd = np.array([0.0, 1.0, 3.0])
+    grid = Grid([x_bd, y_bd])
+
+    assert not grid.is_uniform
+    assert np.allclose(grid.widths[0], [0.1, 0.2, 0.3, 0.4])
+    assert np.allclose(grid.volumes, np.outer(np.diff(x_bd), np.diff(y_bd)))
+
+
+@pytest.mark.parametrize("is_uniform", [True, False])
+def test_refine_coarsen(is_uniform):
+    if is_uniform:
+        grid = Grid.uniform([0.0, 0.0], [1.0, 2.0], (4, 6))
+    else:
+        grid = Grid([np.array([0.0, 0.1, 0.3, 0.6, 1.0]), np.linspace(0.0, 2.0, 7)])
+
+    fine = grid.refine((2, 3))
+    assert fine.shape == (8, 18)
+    assert fine.is_uniform == grid.is_uniform
+
+    coarse = fine.coarsen((2, 3))
+    for x_bd, y_bd in zip(coarse.boundaries, grid.boundaries):
+        assert np.allclose(x_bd, y_bd)
+
+    with pytest.raises(ValueError):
+        grid.coarsen(4)
+
+    x, y = fine.mesh()
+    u = np.sin(x) * np.cos(y)
+    u_coarse = fine.restrict(u, (2, 3))
+
+    assert u_coarse.shape == grid.shape
+    assert np.isclose(np.sum(u_coarse * grid.volumes), np.sum(u * fine.volumes))
+    assert np.allclose(fine.restrict(grid.prolong(u_coarse, (2, 3)), (2, 3)), u_coarse)
@@ -1,5 +1,6 @@
 import lmmr
 import numpy as np
+import pytest
 
 
 def test_uniform_bin_indices():
@@ -15,3 +16,174 @@ def test_uniform_bin_indices():
 
         i_minmax = lmmr.index_magic.uniform_bin_index(x, min_max_n=(xmin, xmax, n))
         assert i_minmax == i, f"{x}, {i}"
+
+
+def sorted_percentile_indices(values, percentiles):
+    n_values = values.size
+    ranked_values = sorted(np.arange(n_values), key=lambda i: values[i])
+    return [ranked_values[int(p * (n_values - 1))] for p in percentiles]
+
+
+def test_percentile_indices():
+    percentiles = [0.0, 0.1, 0.5, 0.75, 0.9, 0.99, 1.0]
+
+    for values in [np.random.random(1000), np.random.randint(0, 10, size=1001)]:
+        I = lmmr.index_magic.percentile_indices(values, percentiles)
+        I_ref = sorted_percentile_indices(values, percentiles)
+        assert np.all(I == I_ref)
+
+
+def test_percentile_indices_axis():
+    percentiles = [0.0, 0.5, 0.9, 1.0]
+    values = np.random.randint(0, 20, size=(3, 100, 4))
+
+    I = lmmr.index_magic.percentile_indices(values, percentiles, axis=1)
+    assert I.shape == (3, len(percentiles), 4)
+
+    for i in range(values.shape[0]):
+        for j in range(values.shape[2]):
+            I_ref = sorted_percentile_indices(values[i, :, j], percentiles)
+            assert np.all(I[i, :, j] == I_ref)
+
+    expected = np.percentile(values, 50.0, axis=1, method="lower")
+    assert np.all(np.take_along_axis(values, I, axis=1)[:, 1, :] == expected)
+
+
+def test_percentile_indices_nan():
+    percentiles = [0.0, 0.5, 1.0]
+    values = np.random.random((5, 101))
+    values[1, ::3] = np.nan
+
+    I = lmmr.index_magic.percentile_indices(values, percentiles, axis=-1)
+    for i in range(values.shape[0]):
+        is_valid = np.logical_not(np.isnan(values[i]))
+        I_ref = sorted_percentile_indices(values[i, is_valid], percentiles)
+        assert np.all(I[i] == np.flatnonzero(is_valid)[I_ref])
+
+    with pytest.raises(ValueError):
+        lmmr.index_magic.percentile_indices(values, percentiles, nan_policy="raise")
+
+    with pytest.raises(ValueError):
+        lmmr.index_magic.percentile_indices(np.full(10, np.nan), percentiles)
+
+    with pytest.raises(ValueError, match="empty"):
+        lmmr.index_magic.percentile_indices(np.empty(0), percentiles)
+
+
+def test_quantile_sketch_exact():
+    percentiles = [0.0, 0.1, 0.5, 0.9, 1.0]
+    values = np.random.random(50)
+
+    sketch = lmmr.index_magic.QuantileSketch(k=100, track_indices=True)
+    sketch.update(values[:20])
+    sketch.update(values[20:])
+
+    I = lmmr.index_magic.percentile_indices(values, percentiles)
+    assert np.all(sketch.quantile_indices(percentiles) == I)
+    assert np.all(sketch.quantile(percentiles) == values[I])
+
+
+def test_quantile_sketch():
+    percentiles = np.array([0.01, 0.1, 0.5, 0.9, 0.99])
+    values = np.random.random(200_000)
+    values[::1000] = np.nan
+
+    sketches = []
+    for k, chunk in enumerate(np.split(values, 8)):
+        sketch = lmmr.index_magic.QuantileSketch(k=200, track_indices=True)
+        for offset in range(0, chunk.size, 5000):
+            indices = k * chunk.size + offset + np.arange(5000)
+            sketch.update(chunk[offset : offset + 5000], indices=indices)
+
+        sketches.append(sketch)
+
+    sketch = sketches[0]
+    for other in sketches[1:]:
+        sketch.merge(other)
+
+    n_valid = np.sum(np.logical_not(np.isnan(values)))
+    assert sketch.n_values == n_valid
+    assert sum(v.size for v in sketch.levels) < 3 * sketch.k
+
+    # The values are uniform, i.e. the value is the rank.
+    q = sketch.quantile(percentiles)
+    assert np.all(np.abs(q - percentiles) < 0.02)
+
+    I = sketch.quantile_indices(percentiles)
+    assert np.all(values[I] == q)
+
+
+def test_bin_index():
+    edges = np.array([-0.1, 0.0, 0.1, 0.2, 0.3])
+
+    tests = [(-0.11, 0), (-0.1, 0), (-0.0001, 0), (0.0, 1), (0.3, 3), (0.333, 3)]
+    for x, i in tests:
+        assert lmmr.index_magic.bin_index(x, edges) == i, f"{x}, {i}"
+
+
+def test_histogram():
+    edges = np.array([0.0, 0.1, 0.5, 1.0])
+    binning = lmmr.index_magic.Binning([(0.0, 1.0, 5), edges])
+    assert binning.shape == (5, 3)
+
+    x = np.random.random((10_000, 2))
+    values = np.random.random(10_000)
+
+    histogram = lmmr.index_magic.Histogram(binning)
+    for chunk in np.split(np.arange(x.shape[0]), 4):
+        histogram.add(x[chunk], values[chunk])
+
+    expected_count, _, _ = np.histogram2d(x[:, 0], x[:, 1], binning.edges)
+    assert np.all(histogram.count == expected_count)
+
+    i = lmmr.index_magic.uniform_bin_index(x[:, 0], min_max_n=(0.0, 1.0, 5))
+    j = lmmr.index_magic.bin_index(x[:, 1], edges)
+    for ij in [(0, 0), (2, 1), (4, 2)]:
+        v = values[np.logical_and(i == ij[0], j == ij[1])]
+        assert np.isclose(histogram.sum[ij], np.sum(v))
+        assert np.isclose(histogram.mean[ij], np.mean(v))
+        assert np.isclose(histogram.variance[ij], np.var(v, ddof=1))
+        assert histogram.min[ij] == np.min(v)
+        assert histogram.max[ij] == np.max(v)
+
+
+def test_histogram_reuse_index():
+    x = np.random.random(1000)
+    binning = lmmr.index_magic.Binning((0.0, 0.5, 10))
+    index = binning.index(x)
+
+    first, second = [lmmr.index_magic.Histogram(binning) for _ in range(2)]
+    first.add(index=index[:300], values=x[:300])
+    second.add(index=index[300:], values=x[300:])
+    first.merge(second)
+
+    expected = lmmr.index_magic.Histogram(binning)
+    expected.add(x, x)
+
+    assert np.all(first.count == expected.count)
+    assert np.allclose(first.mean, expected.mean)
+    assert np.allclose(first.variance, expected.variance)
+
+    # Values beyond `xmax` end up in the last bin.
+    assert np.isclose(first.max[-1], np.max(x))
+
+
+def test_histogram_count_only():
+    binning = lmmr.index_magic.Binning((0.0, 1.0, 1))
+    x = np.array([0.25, 0.75])
+
+    histogram = lmmr.index_magic.Histogram(binning)
+    histogram.add(x)
+    histogram.add(x, [1.0, 3.0])
+
+    assert histogram.count[0] == 4
+    assert histogram.mean[0] == 2.0
+    assert histogram.variance[0] == 2.0
+
+    counts = lmmr.index_magic.Histogram(binning)
+    counts.add(x)
+    counts.merge(histogram)
+
+    assert counts.count[0] == 6
+    assert counts.mean[0] == 2.0
+    assert np.isnan(lmmr.index_magic.Histogram(binning).mean[0])
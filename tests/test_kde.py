@@ -0,0 +1,83 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2021 ETH Zurich, Luc Grosheintz-Laval
+
+import numpy as np
+
+import lmmr
+
+
+def direct_kde(x, samples, h):
+    z = (x[:, np.newaxis, :] - samples[np.newaxis, :, :]) / h
+    k = np.exp(-0.5 * np.sum(z ** 2, axis=-1)) / np.prod(np.sqrt(2.0 * np.pi) * h)
+    return np.mean(k, axis=1)
+
+
+def test_linear_binning():
+    centers = [np.linspace(0.0, 1.0, 5), np.linspace(-1.0, 1.0, 3)]
+    x = np.array([[0.125, 0.0], [0.5, 0.5], [2.0, -2.0]])
+
+    counts = lmmr.index_magic.linear_binning(x, centers)
+    expected = np.zeros((5, 3))
+    expected[0, 1] = expected[1, 1] = 0.5
+    expected[2, 1] = expected[2, 2] = 0.5
+    expected[4, 0] = 1.0
+
+    assert np.allclose(counts, expected)
+
+
+def test_binned_kde_1d():
+    samples = np.random.normal(size=2000)
+    h = lmmr.kde.silverman_bandwidth(samples)
+    assert 0.5 * 2000 ** (-0.2) < h < 1.2 * 2000 ** (-0.2)
+
+    x, density = lmmr.kde.binned_kde(samples, n_points=512)
+    assert x.shape == density.shape == (512,)
+    assert np.isclose(np.sum(density) * (x[1] - x[0]), 1.0, rtol=1e-3)
+
+    expected = direct_kde(x[:, np.newaxis], samples[:, np.newaxis], h)
+    assert np.max(np.abs(density - expected)) < 1e-3 * np.max(expected)
+
+
+def test_binned_kde_2d():
+    samples = np.random.normal(size=(1000, 2)) * [1.0, 0.5]
+    h = np.array([0.3, 0.2])
+
+    (x, y), density = lmmr.kde.binned_kde(samples, n_points=(128, 64), bandwidth=h)
+    assert density.shape == (128, 64)
+
+    dA = (x[1] - x[0]) * (y[1] - y[0])
+    assert np.isclose(np.sum(density) * dA, 1.0, rtol=1e-3)
+
+    X, Y = np.meshgrid(x, y, indexing="ij")
+    points = np.stack([X.reshape(-1), Y.reshape(-1)], axis=1)
+    expected = direct_kde(points, samples, h).reshape(X.shape)
+    assert np.max(np.abs(density - expected)) < 5e-3 * np.max(expected)
+
+
+def test_binned_kde_coarse_grid():
+    samples = np.random.normal(size=100_000)
+
+    for n_points in [32, 64]:
+        x, density = lmmr.kde.binned_kde(samples, n_points=n_points, bandwidth=0.05)
+        assert np.isclose(np.sum(density) * (x[1] - x[0]), 1.0, rtol=1e-3)
+
+
+def test_binned_kde_constant():
+    x, density = lmmr.kde.binned_kde(np.full(100, 2.0), n_points=65)
+
+    assert np.all(np.isfinite(density))
+    assert np.isclose(np.sum(density) * (x[1] - x[0]), 1.0, rtol=1e-2)
+    assert x[np.argmax(density)] == 2.0
+
+
+def test_binned_kde_bounds():
+    samples = np.random.normal(size=10_000)
+    is_inside = np.abs(samples) <= 1.0
+
+    x, density = lmmr.kde.binned_kde(samples, bandwidth=0.1, bounds=(-1.0, 1.0))
+    _, expected = lmmr.kde.binned_kde(
+        samples[is_inside], bandwidth=0.1, bounds=(-1.0, 1.0)
+    )
+
+    assert np.all(density == expected)
+    assert density[0] < 0.5 * np.max(density)
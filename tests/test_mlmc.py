@@ -0,0 +1,53 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2021 ETH Zurich, Luc Grosheintz-Laval
+
+import numpy as np
+
+import lmmr
+from lmmr.io.latex_tables import LatexConvergenceTable
+
+
+def sampler(level, n_samples):
+    # Y_0 = P_0 ~ N(1, 1) and Y_l ~ N(2**-l, 4**-l).
+    if level == 0:
+        return lmmr.random.normal(1.0, 1.0, size=n_samples)
+
+    return lmmr.random.normal(2.0 ** -level, 2.0 ** -level, size=n_samples)
+
+
+def test_mlmc():
+    lmmr.random.seed(42)
+    rmse = 5e-3
+
+    mlmc = lmmr.mlmc.MLMC(sampler, costs=lambda level: 2.0 ** level)
+    estimate = mlmc.run(rmse)
+
+    n_levels = mlmc.n_levels
+    exact = 2.0 - 2.0 ** -(n_levels - 1)
+
+    assert mlmc.converged
+    assert np.abs(estimate - exact) < 3.0 * rmse
+    assert np.all(np.diff(mlmc.n_samples) <= 0)
+    assert mlmc.bias() < 2.0 * 2.0 ** -n_levels
+
+    resolutions, errors, rates = mlmc.convergence_data()
+    assert np.allclose(rates[0][:4], 1.0, atol=0.2)
+    assert np.allclose(rates[1][:4], 2.0, atol=0.2)
+
+    table = LatexConvergenceTable(errors, rates, resolutions, ["mean", "var"])
+    assert "tabular" in table.table
+
+
+def test_mlmc_zero_mean():
+    def zero_on_level_one(level, n_samples):
+        if level == 1:
+            return np.zeros(n_samples)
+
+        return sampler(level, n_samples)
+
+    mlmc = lmmr.mlmc.MLMC(zero_on_level_one, costs=lambda level: 2.0 ** level)
+    for level in range(4):
+        mlmc.add_samples(level, 100)
+
+    assert np.isfinite(mlmc.bias())
+    assert np.all(mlmc.optimal_n_samples(1e-2) >= 0)
@@ -0,0 +1,72 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2021 ETH Zurich, Luc Grosheintz-Laval
+
+import concurrent.futures
+import os
+
+import numpy as np
+import pytest
+
+import lmmr
+import lmmr.qmc
+
+
+def square_rows(x):
+    return np.sum(x ** 2, axis=1)
+
+
+def swap(samples):
+    x, y = samples
+    return y, x
+
+
+def test_chunk_bounds():
+    assert lmmr.parallel.chunk_bounds(10, 3) == [(0, 3), (3, 6), (6, 10)]
+    assert lmmr.parallel.chunk_bounds(2, 4) == [(0, 1), (1, 2)]
+
+
+def test_map_chunks():
+    x = np.random.uniform(size=(1001, 3))
+    y = np.random.uniform(size=(1001,))
+
+    for Executor in [
+        concurrent.futures.ThreadPoolExecutor,
+        concurrent.futures.ProcessPoolExecutor,
+    ]:
+        with Executor(max_workers=2) as executor:
+            fx = lmmr.parallel.map_chunks(square_rows, x, executor, n_chunks=7)
+            assert np.all(fx == square_rows(x))
+
+            yx = lmmr.parallel.map_chunks(swap, (x, y), executor, n_chunks=7)
+            assert np.all(yx[0] == y) and np.all(yx[1] == x)
+
+
+def test_sobol_indices_executor():
+    with concurrent.futures.ProcessPoolExecutor(max_workers=2) as executor:
+        S, S_tot = lmmr.qmc.sobol_indices(square_rows, 3, 256, executor=executor)
+
+    assert np.all(S == lmmr.qmc.sobol_indices(square_rows, 3, 256)[0])
+    assert np.all(S_tot == lmmr.qmc.sobol_indices(square_rows, 3, 256)[1])
+
+
+def fail_first_chunk(x):
+    if x[0, 0] == 0.0:
+        raise ValueError("first chunk")
+
+    return square_rows(x)
+
+
+def shared_memory_segments():
+    return {name for name in os.listdir("/dev/shm") if name.startswith("psm_")}
+
+
+def test_map_chunks_failure_releases_shared_memory():
+    x = np.random.uniform(size=(100, 3))
+    x[0, 0] = 0.0
+
+    before = shared_memory_segments()
+    with concurrent.futures.ProcessPoolExecutor(max_workers=2) as executor:
+        with pytest.raises(ValueError):
+            lmmr.parallel.map_chunks(fail_first_chunk, x, executor, n_chunks=10)
+
+    assert shared_memory_segments() <= before
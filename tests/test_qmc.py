@@ -1,6 +1,10 @@
 # SPDX-License-Identifier: MIT
 # Copyright (c) 2021 ETH Zurich, Luc Grosheintz-Laval
 
+import os
+import functools
+import tempfile
+
 import numpy as np
 
 import lmmr
@@ -51,3 +55,215 @@ def test_sobol_variances():
                 exact = 0.0004
 
             assert np.abs(S_ij - exact) < eps
+
+
+def test_sobol_points():
+    expected = np.array(
+        [
+            [0.0, 0.0, 0.0],
+            [0.5, 0.5, 0.5],
+            [0.75, 0.25, 0.75],
+            [0.25, 0.75, 0.25],
+            [0.375, 0.375, 0.625],
+            [0.875, 0.875, 0.125],
+            [0.625, 0.125, 0.375],
+            [0.125, 0.625, 0.875],
+        ]
+    )
+
+    assert np.all(lmmr.qmc.sobol_points(3, 8) == expected)
+    assert np.all(lmmr.qmc.sobol_points(3, 5, seed=3) == expected[3:])
+
+    domain = [[-1.0, 1.0], [0.0, 2.0], [2.0, 3.0]]
+    x = lmmr.qmc.sobol_points(domain, 8)
+    assert np.all(x == lmmr.qmc.rescale(expected, domain))
+
+
+def test_sobol_points_blocks():
+    n_samples = 3 * lmmr.qmc._SOBOL_BLOCK_SIZE // 2
+    x = lmmr.qmc.sobol_points(40, n_samples)
+
+    offset = lmmr.qmc._SOBOL_BLOCK_SIZE - 7
+    y = lmmr.qmc.sobol_points(40, 100, seed=offset)
+
+    assert np.all(x[offset : offset + 100] == y)
+
+
+def test_iter_sobol_points():
+    domain = [[-1.0, 1.0], [0.0, 2.0]]
+    x = lmmr.qmc.sobol_points(domain, 1000, seed=10)
+
+    chunks = list(lmmr.qmc.iter_sobol_points(domain, 1000, 300, seed=10))
+    assert [c.shape[0] for c in chunks] == [300, 300, 300, 100]
+    assert np.all(np.concatenate(chunks) == x)
+
+
+def test_sobol_indices():
+    def g(x, a):
+        return np.prod((np.abs(4.0 * x - 2.0) + a) / (1.0 + a), axis=1)
+
+    a = np.array(2 * [0.0] + 6 * [3.0])
+    n_params = a.shape[0]
+
+    Vi = 1.0 / (3.0 * (1.0 + a) ** 2)
+    V = np.prod(1.0 + Vi) - 1.0
+    exact_S = Vi / V
+    exact_S_tot = Vi * np.prod(1.0 + Vi) / (1.0 + Vi) / V
+    exact_S2 = np.outer(Vi, Vi) / V
+
+    S, S_tot, S2 = lmmr.qmc.sobol_indices(
+        lambda x: g(x, a), n_params, 10_000, second_order=True
+    )
+
+    eps = 0.03
+    assert np.all(np.abs(S - exact_S) < eps)
+    assert np.all(np.abs(S_tot - exact_S_tot) < eps)
+
+    off_diagonal = np.logical_not(np.eye(n_params, dtype=bool))
+    assert np.all(np.abs(S2 - exact_S2)[off_diagonal] < eps)
+    assert np.all(np.isnan(S2[np.logical_not(off_diagonal)]))
+
+
+def test_sobol_variance_estimator():
+    def g(x):
+        return np.stack([np.sum(x ** 2, axis=1), np.prod(x, axis=1)], axis=1)
+
+    n_params, indices = 4, [0, 2]
+    Sy, Stot_y = lmmr.qmc.sobol_variances(g, n_params, 4000, indices)
+
+    sv = lmmr.qmc.SobolVarianceEstimator(g, n_params, indices, chunk_size=300)
+    assert np.all(np.isnan(sv.sobol_indices()))
+
+    sv.extend(1000)
+    sv.extend(500)
+
+    other = lmmr.qmc.SobolVarianceEstimator(g, n_params, indices, seed=1500)
+    other.extend(2500)
+    sv.merge(other)
+
+    assert sv.n_samples == 4000
+    assert np.allclose(sv.sobol_indices(), (Sy, Stot_y), rtol=1e-12)
+
+    # After merging, `extend` continues after the part covered by `other`.
+    first = lmmr.qmc.SobolVarianceEstimator(g, n_params, indices)
+    first.extend(1000)
+    other = lmmr.qmc.SobolVarianceEstimator(g, n_params, indices, seed=1000)
+    other.extend(2000)
+    first.merge(other)
+    first.extend(1000)
+
+    assert first.seed == 4000
+    assert np.allclose(first.sobol_indices(), (Sy, Stot_y), rtol=1e-12)
+
+    sv = lmmr.qmc.SobolVarianceEstimator(g, n_params, indices)
+    Sy, Stot_y = sv.run(rtol=1e-2)
+
+    assert sv.converged
+    assert Sy.shape == (2,)
+
+
+def test_scrambled_sobol_points():
+    n_samples, n_replicates, n_dims = 1024, 4, 3
+
+    for scramble in ["owen", "linear", "shift"]:
+        x = lmmr.qmc.scrambled_sobol_points(
+            n_dims, n_samples, n_replicates, scramble=scramble
+        )
+        assert x.shape == (n_replicates, n_samples, n_dims)
+
+        # Scrambling preserves the net property, i.e. each of the
+        # `n_samples` intervals contains exactly one point.
+        cells = np.sort(np.floor(x * n_samples), axis=1)
+        assert np.all(cells == np.arange(n_samples)[:, np.newaxis])
+
+        assert not np.all(x[0] == x[1])
+
+
+def test_rqmc_mean():
+    x = lmmr.qmc.scrambled_sobol_points(4, 4096, 16)
+    mean, error = lmmr.qmc.rqmc_mean(np.sum(x ** 2, axis=-1))
+
+    assert np.abs(mean - 4.0 / 3.0) < 5.0 * error
+    assert error < 1e-4
+
+
+def test_lattice_points():
+    n_samples, n_dims = 1024, 4
+    x = lmmr.qmc.lattice_points(n_dims, n_samples)
+
+    z = np.array(lmmr.qmc._LATTICE_GENERATING_VECTOR[:n_dims])
+    k = np.arange(n_samples)[:, np.newaxis]
+    expected = np.mod(k * z, n_samples) / n_samples
+
+    # The first `2**m` points are the lattice rule, in a different order.
+    assert np.all(np.sort(x, axis=0) == np.sort(expected, axis=0))
+    assert np.all(lmmr.qmc.lattice_points(n_dims, 100, seed=50) == x[50:150])
+
+    shift = np.full(n_dims, 0.25)
+    y = lmmr.qmc.lattice_points(n_dims, n_samples, shift=shift)
+    assert np.allclose(y, np.mod(x + shift, 1.0))
+
+
+def test_halton_points():
+    x = lmmr.qmc.halton_points(2, 4)
+    expected = np.array([[0.0, 0.0], [0.5, 1 / 3], [0.25, 2 / 3], [0.75, 1 / 9]])
+    assert np.allclose(x, expected)
+
+    permutations = lmmr.qmc.halton_permutations(3)
+    x = lmmr.qmc.halton_points(3, 150, permutations=permutations)
+    y = lmmr.qmc.halton_points(3, 100, seed=50, permutations=permutations)
+
+    assert np.all(x[50:] == y)
+    assert np.all(np.logical_and(0.0 <= x, x < 1.0))
+
+
+def test_sobol_indices_points():
+    def f(x):
+        return x[:, 0] + 2.0 * x[:, 1]
+
+    for points in [lmmr.qmc.lattice_points, lmmr.qmc.halton_points]:
+        S, S_tot = lmmr.qmc.sobol_indices(f, 2, 4096, points=points)
+        assert np.allclose(S, [0.2, 0.8], atol=0.01)
+
+
+def test_point_set_cache():
+    with tempfile.TemporaryDirectory() as wd:
+        cache = lmmr.qmc.PointSetCache(wd, max_bytes=50_000)
+        points = cache.wrap(lmmr.qmc.sobol_points)
+
+        x = points(2, 1000, seed=3)
+        assert isinstance(x, np.memmap)
+        assert not x.flags.writeable
+        assert np.all(x == lmmr.qmc.sobol_points(2, 1000, seed=3))
+
+        y = points(2, 1000, seed=3)
+        assert y.filename == x.filename
+
+        shift = np.full(2, 0.5)
+        z = cache.get(lmmr.qmc.lattice_points, 2, 1000, shift=shift)
+        assert np.all(z == lmmr.qmc.lattice_points(2, 1000, shift=shift))
+
+        for seed in range(3):
+            points(2, 1000, seed=seed)
+
+        assert len(os.listdir(wd)) == 3
+        assert not os.path.exists(z.filename)
+
+
+def test_point_set_cache_partial():
+    permutations = lmmr.qmc.halton_permutations(2)
+    halton = functools.partial(lmmr.qmc.halton_points, permutations=permutations)
+
+    with tempfile.TemporaryDirectory() as wd:
+        cache = lmmr.qmc.PointSetCache(wd)
+
+        x = cache.get(halton, 2, 100)
+        assert np.all(x == halton(2, 100))
+        assert os.path.basename(x.filename).startswith("halton_points-")
+
+        y = cache.get(lmmr.qmc.halton_points, 2, 100)
+        assert y.filename != x.filename
+
+        umask = os.umask(0)
+        os.umask(umask)
+        assert os.stat(x.filename).st_mode & 0o777 == 0o666 & ~umask
@@ -0,0 +1,85 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2021 ETH Zurich, Luc Grosheintz-Laval
+
+import concurrent.futures
+
+import numpy as np
+
+import lmmr
+
+
+def draw(n_samples):
+    return lmmr.random.uniform(size=n_samples)
+
+
+def test_seed():
+    lmmr.random.seed(42)
+    x = lmmr.random.uniform(size=10)
+
+    lmmr.random.seed(42)
+    assert np.all(lmmr.random.uniform(size=10) == x)
+
+
+def test_thread_streams():
+    lmmr.random.seed(42)
+    x = lmmr.random.uniform(size=10)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+        y = executor.submit(draw, 10).result()
+        z = executor.submit(draw, 10).result()
+
+    assert not np.any(x == y)
+    assert not np.any(y == z)
+
+
+def test_stream():
+    lmmr.random.seed(42)
+    seeds = lmmr.random.spawn(2)
+
+    with lmmr.random.stream(seeds[0]):
+        x = draw(10)
+
+        with lmmr.random.stream(seeds[1]):
+            y = draw(10)
+
+    assert np.all(x == np.random.default_rng(seeds[0]).uniform(size=10))
+    assert np.all(y == np.random.default_rng(seeds[1]).uniform(size=10))
+
+
+def test_draw_chunks_reproducible():
+    results = []
+    for Executor in [
+        concurrent.futures.ThreadPoolExecutor,
+        concurrent.futures.ProcessPoolExecutor,
+    ]:
+        for max_workers in [1, 3]:
+            lmmr.random.seed(42)
+            with Executor(max_workers=max_workers) as executor:
+                results.append(
+                    lmmr.parallel.draw_chunks(draw, 1000, executor, n_chunks=7)
+                )
+
+    for x in results[1:]:
+        assert np.all(x == results[0])
+
+    assert np.unique(results[0]).size == 1000
+
+
+def test_fork_reproducible():
+    import multiprocessing
+
+    context = multiprocessing.get_context("fork")
+
+    results = []
+    for _ in range(2):
+        lmmr.random.seed(42)
+        x = lmmr.random.uniform(size=10)
+
+        with concurrent.futures.ProcessPoolExecutor(1, mp_context=context) as executor:
+            y = executor.submit(draw, 10).result()
+
+        results.append((x, y))
+
+    (x0, y0), (x1, y1) = results
+    assert np.all(x0 == x1) and np.all(y0 == y1)
+    assert not np.any(x0 == y0)
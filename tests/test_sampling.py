@@ -1,4 +1,10 @@
+import concurrent.futures
+import os
+import tempfile
+
+import h5py
 import numpy as np
+import pytest
 
 import lmmr
 
@@ -36,3 +42,177 @@ def test_rejection_sampling_2d():
 
     assert np.all(x ** 2 + y ** 2 <= rcrit ** 2), "Radius too large."
     assert x.shape == (n_samples,)
+
+
+def test_rejection_sampling_executor():
+    def rng(n_samples):
+        return lmmr.random.uniform(-1.0, 3.0, size=(n_samples))
+
+    def reject_if(x):
+        return np.abs(x) > 0.5
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+        x = lmmr.sampling.rejection_sampling(100, rng, reject_if, executor)
+
+    assert np.all(np.abs(x) <= 0.5)
+    assert x.shape == (100,)
+
+
+def test_multivariate_normal():
+    A = lmmr.random.normal(size=(4, 4))
+    cov_pd = A @ A.T + np.eye(4)
+    cov_psd = A[:, :2] @ A[:, :2].T
+
+    for cov in [cov_pd, cov_psd]:
+        mean = np.arange(4.0)
+        x = lmmr.sampling.multivariate_normal(mean, cov, size=200_000)
+
+        assert x.shape == (200_000, 4)
+        assert np.allclose(np.mean(x, axis=0), mean, atol=0.05)
+        assert np.allclose(np.cov(x.T), cov, rtol=0.05, atol=0.05)
+
+    sampler = lmmr.sampling.cached_multivariate_normal(cov_pd)
+    assert sampler is lmmr.sampling.cached_multivariate_normal(cov_pd.copy())
+
+
+def test_cached_multivariate_normal_same_array(monkeypatch):
+    cov = np.eye(3)
+    sampler = lmmr.sampling.cached_multivariate_normal(cov)
+
+    # The same array object isn't hashed again.
+    monkeypatch.setattr(lmmr.sampling.hashlib, "sha1", None)
+    assert lmmr.sampling.cached_multivariate_normal(cov) is sampler
+
+    same = lmmr.sampling.cached_multivariate_normal(cov, assume_unchanged=True)
+    assert same is sampler
+
+    x = lmmr.sampling.multivariate_normal(np.zeros(3), cov, 10, assume_unchanged=True)
+    assert x.shape == (10, 3)
+    monkeypatch.undo()
+
+    assert lmmr.sampling.cached_multivariate_normal(2.0 * cov) is not sampler
+
+
+def test_multivariate_normal_modified_in_place():
+    cov = np.eye(2)
+    lmmr.sampling.multivariate_normal(np.zeros(2), cov, size=10)
+
+    cov *= 100.0
+    x = lmmr.sampling.multivariate_normal(np.zeros(2), cov, size=100_000)
+    assert np.allclose(np.var(x, axis=0), 100.0, rtol=0.05)
+
+
+def test_multivariate_normal_batched_means():
+    sampler = lmmr.sampling.MultivariateNormal(np.eye(3))
+    means = np.array([[0.0, 0.0, 0.0], [100.0, 100.0, 100.0]])
+
+    x = sampler(means, size=(1000, 2))
+    assert x.shape == (1000, 2, 3)
+    assert np.all(x[:, 0, :] < 50.0) and np.all(x[:, 1, :] > 50.0)
+
+    assert sampler(means).shape == (2, 3)
+
+
+def test_rejection_sampler():
+    def rng(n_samples):
+        return {
+            "x": lmmr.random.uniform(-1.0, 1.0, size=(n_samples,)),
+            "y": lmmr.random.uniform(-1.0, 1.0, size=(n_samples, 2)),
+        }
+
+    def reject_if(samples):
+        return np.abs(samples["x"]) > 1e-3
+
+    sampler = lmmr.sampling.RejectionSampler(rng, reject_if)
+    samples = sampler(100)
+
+    assert samples["x"].shape == (100,)
+    assert samples["y"].shape == (100, 2)
+    assert np.all(np.abs(samples["x"]) <= 1e-3)
+    assert np.abs(sampler.acceptance_rate - 1e-3) < 5e-4
+
+    n_surplus = sampler.surplus["x"].shape[0]
+    n_drawn = sampler.n_drawn
+    sampler(n_surplus)
+    assert sampler.n_drawn == n_drawn
+    assert sampler.surplus is None
+
+
+def test_rejection_sampling_budget():
+    def rng(n_samples):
+        return lmmr.random.uniform(size=(n_samples,))
+
+    def reject_if(x):
+        return x > 1e-6
+
+    with pytest.raises(RuntimeError):
+        lmmr.sampling.rejection_sampling(100, rng, reject_if, max_draws=10_000)
+
+    # The last batch is shrunk to fit into the budget.
+    def alternating(n_samples):
+        return np.arange(n_samples) % 2
+
+    x = lmmr.sampling.rejection_sampling(100, alternating, reject_if, max_draws=200)
+    assert np.all(x == 0) and x.shape == (100,)
+
+
+def test_joint_choice():
+    a = lmmr.random.uniform(size=(1000, 3))
+    b = lmmr.random.uniform(size=(2, 1000))
+
+    (sa, sb), I = lmmr.sampling.joint_choice((a, b.T), 100)
+    assert np.all(sa == a[I]) and np.all(sb == b.T[I])
+
+    with tempfile.TemporaryDirectory() as wd:
+        filename = os.path.join(wd, "a.h5")
+        with h5py.File(filename, "w") as h5:
+            h5["b"] = b
+
+        b_memmap = np.lib.format.open_memmap(
+            os.path.join(wd, "b.npy"), mode="w+", shape=b.shape, dtype=b.dtype
+        )
+        b_memmap[...] = b
+
+        with h5py.File(filename, "r") as h5:
+            for n in [10, 900]:
+                (sb_h5, sb_memmap), I = lmmr.sampling.joint_choice(
+                    (h5["b"], b_memmap), n, axis=1, chunk_size=7
+                )
+
+                assert np.all(sb_h5 == b[:, I])
+                assert np.all(sb_memmap == b[:, I])
+
+        with h5py.File(filename, "r") as h5:
+            c = lmmr.random.uniform(size=(3, 2, 1000))
+            (sc, sb_h5), I = lmmr.sampling.joint_choice((c, h5["b"]), 10, axis=-1)
+
+            assert sc.shape == (3, 2, 10) and sb_h5.shape == (2, 10)
+            assert np.all(sc == c[..., I]) and np.all(sb_h5 == b[:, I])
+
+
+def test_reservoir_sampling():
+    N, n = 1000, 50
+    x = np.arange(N)
+    y = lmmr.random.uniform(size=(N, 2))
+
+    def chunks():
+        return ((x[k : k + 77], y[k : k + 77]) for k in range(0, N, 77))
+
+    lmmr.random.seed(42)
+    (sx, sy), I = lmmr.sampling.reservoir_sampling(chunks(), n)
+
+    assert np.unique(I).size == n
+    assert np.all(sx == I) and np.all(sy == y[I])
+
+    lmmr.random.seed(42)
+    assert np.all(lmmr.sampling.reservoir_sampling(chunks(), n)[1] == I)
+
+    (sx, sy), I = lmmr.sampling.reservoir_sampling(chunks(), 2 * N)
+    assert np.all(np.sort(I) == x)
+
+    def weights(chunk):
+        return (chunk[0] % 2 == 0).astype(float)
+
+    (sx, sy), I = lmmr.sampling.reservoir_sampling(chunks(), n, weights=weights)
+    assert np.unique(I).size == n
+    assert np.all(sx == I) and np.all(I % 2 == 0)
@@ -0,0 +1,30 @@
+# SPDX-License-Identifier: MIT
+# Copyright (c) 2021 ETH Zurich, Luc Grosheintz-Laval
+
+import numpy as np
+
+import lmmr
+
+
+def statistics(x, cross=None):
+    mean = np.mean(x, axis=-1)
+    dx = x - mean[..., np.newaxis]
+    dy = dx if cross is None else dx[cross]
+
+    return x.shape[-1], mean, np.sum(dy * dx, axis=-1)
+
+
+def test_merge_moments():
+    x = np.random.normal(size=(3, 100))
+
+    for cross in [None, 0]:
+        a, b = statistics(x[:, :30], cross), statistics(x[:, 30:], cross)
+        n, mean, M2 = lmmr.utilities.merge_moments(a, b, cross=cross)
+        n_ref, mean_ref, M2_ref = statistics(x, cross)
+
+        assert n == n_ref
+        assert np.allclose(mean, mean_ref) and np.allclose(M2, M2_ref)
+
+    empty = (np.zeros(3, dtype=np.int64), np.zeros(3), np.zeros(3))
+    n, mean, M2 = lmmr.utilities.merge_moments(empty, empty)
+    assert np.all(n == 0) and np.all(mean == 0.0) and np.all(M2 == 0.0)